@@ -6,14 +6,30 @@ Uses native OS tools (ripgrep, fd) for maximum speed and efficiency.
 """
 
 import asyncio
+import contextlib
+import functools
+import gc
+import hashlib
+import io
+import itertools
 import json
+import math
 import os
+import re
+import secrets
+import shutil
 import sqlite3
 import subprocess
 import sys
+import threading
 import time
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 import argparse
 import logging
 
@@ -41,6 +57,12 @@ try:
 except ImportError:
     magic = None
 
+# NumPy is only needed for similarity search
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -54,6 +76,8 @@ class SearchResult:
         self.column = column
         self.content = content
         self.score = score
+        self.context_before: List[str] = []
+        self.context_after: List[str] = []
 
 class FileIndexer:
     """Handles file indexing and caching using SQLite."""
@@ -91,22 +115,63 @@ class FileIndexer:
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_info_cache (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                file_size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                file_type TEXT NOT NULL,
+                preview TEXT,
+                spilled_at REAL NOT NULL,
+                PRIMARY KEY (device, inode, file_size, mtime_ns)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS query_log (
+                tool TEXT NOT NULL,
+                params TEXT NOT NULL,
+                root TEXT NOT NULL,
+                max_limit INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (tool, params)
+            )
+        ''')
+        
+        # Columns added after the first release of search_cache
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(search_cache)')}
+        if 'root' not in columns:
+            cursor.execute('ALTER TABLE search_cache ADD COLUMN root TEXT')
+        if 'result_limit' not in columns:
+            cursor.execute('ALTER TABLE search_cache ADD COLUMN result_limit INTEGER')
+        if 'complete' not in columns:
+            cursor.execute('ALTER TABLE search_cache ADD COLUMN complete INTEGER NOT NULL DEFAULT 0')
+        
         # Create indexes
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_query ON search_cache(query, search_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_path ON file_metadata(file_path)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_name ON file_metadata(file_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_root ON search_cache(root)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_info_spilled ON file_info_cache(spilled_at)')
         
         conn.commit()
         conn.close()
     
     def cache_results(self, query: str, search_type: str, results: List[SearchResult], 
-                     ttl_seconds: int = 300):
-        """Cache search results with TTL."""
+                     ttl_seconds: int = 300, root: str = None, result_limit: int = None):
+        """Cache search results with TTL.
+        
+        Results from a search that returned fewer than result_limit matches are
+        marked complete, so they can answer the same query with any limit.
+        """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
         now = time.time()
         expires_at = now + ttl_seconds
+        complete = result_limit is None or len(results) < result_limit
         
         # Convert results to JSON
         results_json = json.dumps([
@@ -114,22 +179,30 @@ class FileIndexer:
                 'file_path': r.file_path,
                 'line_number': r.line_number,
                 'column': r.column,
-                'content': r.content,
+                # Matches served with context keep their indentation
+                'content': r.content.strip(),
                 'score': r.score
             } for r in results
         ])
         
         cursor.execute('''
-            INSERT OR REPLACE INTO search_cache 
-            (query, search_type, results, created_at, expires_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (query, search_type, results_json, now, expires_at))
+            DELETE FROM search_cache WHERE query = ? AND search_type = ?
+        ''', (query, search_type))
+        cursor.execute('''
+            INSERT INTO search_cache 
+            (query, search_type, results, created_at, expires_at, root, result_limit, complete)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (query, search_type, results_json, now, expires_at, root, result_limit, int(complete)))
         
         conn.commit()
         conn.close()
     
-    def get_cached_results(self, query: str, search_type: str) -> Optional[List[SearchResult]]:
-        """Get cached search results if they haven't expired."""
+    def get_cached_results(self, query: str, search_type: str,
+                           limit: int = None) -> Optional[List[SearchResult]]:
+        """Get cached search results if they haven't expired.
+        
+        With a limit, results cached for a larger limit are truncated to it.
+        """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -137,13 +210,15 @@ class FileIndexer:
         cursor.execute('''
             SELECT results FROM search_cache 
             WHERE query = ? AND search_type = ? AND expires_at > ?
-        ''', (query, search_type, now))
+            AND (? IS NULL OR complete = 1 OR result_limit >= ?)
+            ORDER BY created_at DESC
+        ''', (query, search_type, now, limit, limit))
         
         result = cursor.fetchone()
         conn.close()
         
         if result:
-            results_data = json.loads(result[0])
+            results_data = json.loads(result[0])[:limit]
             return [
                 SearchResult(
                     file_path=r['file_path'],
@@ -154,16 +229,1683 @@ class FileIndexer:
                 ) for r in results_data
             ]
         return None
+    
+    def invalidate_paths(self, paths: List[str]):
+        """Drop cached results for every search root that contains one of the paths."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            DELETE FROM search_cache
+            WHERE root IS NOT NULL
+            AND (? = root OR substr(?, 1, length(root) + 1) = root || '/')
+        ''', [(path, path) for path in paths])
+        
+        conn.commit()
+        conn.close()
+    
+    def expire_soon(self, roots: List[str], within_seconds: float):
+        """Expire cached results for the roots that would expire within the given time."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            UPDATE search_cache SET expires_at = 0
+            WHERE root = ? AND expires_at < ?
+        ''', [(root, time.time() + within_seconds) for root in roots])
+        
+        conn.commit()
+        conn.close()
+    
+    def log_query(self, tool: str, params: Dict[str, Any], root: str, limit: int):
+        """Record that a search tool was called, for cache warming."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT INTO query_log (tool, params, root, max_limit, hits, last_used)
+            VALUES (?, ?, ?, ?, 1, ?)
+            ON CONFLICT (tool, params) DO UPDATE SET
+                hits = hits + 1,
+                last_used = excluded.last_used,
+                max_limit = MAX(max_limit, excluded.max_limit)
+        ''', (tool, json.dumps(params, sort_keys=True), root, limit, time.time()))
+        
+        conn.commit()
+        conn.close()
+    
+    def frequent_queries(self, count: int, half_life: float, max_age: float,
+                         roots: List[str] = None) -> List[Tuple[str, Dict[str, Any], str, int]]:
+        """Return the queries with the highest recency-weighted hit counts.
+        
+        Each hit counts half as much for every half_life seconds since the query
+        was last used; queries unused for max_age seconds are forgotten.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        now = time.time()
+        cursor.execute('DELETE FROM query_log WHERE last_used < ?', (now - max_age,))
+        cursor.execute('SELECT tool, params, root, max_limit, hits, last_used FROM query_log')
+        rows = cursor.fetchall()
+        
+        conn.commit()
+        conn.close()
+        
+        if roots is not None:
+            rows = [row for row in rows if row[2] in roots]
+        rows.sort(key=lambda row: row[4] * 0.5 ** ((now - row[5]) / half_life), reverse=True)
+        return [
+            (tool, json.loads(params), root, max_limit)
+            for tool, params, root, max_limit, _, _ in rows[:count]
+        ]
+    
+    def spill_file_info(self, entries: List[Tuple[Tuple[int, int, int, int], Tuple[str, Optional[List[str]]]]],
+                        max_age: float, max_rows: int):
+        """Persist file-info cache entries that are being evicted from memory.
+        
+        Rows spilled more than max_age seconds ago are dropped, and beyond
+        max_rows the oldest rows go first, so the table stays bounded.
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        now = time.time()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO file_info_cache
+            (device, inode, file_size, mtime_ns, file_type, preview, spilled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (*key, file_type, json.dumps(preview), now)
+            for key, (file_type, preview) in entries
+        ])
+        cursor.execute('DELETE FROM file_info_cache WHERE spilled_at < ?', (now - max_age,))
+        cursor.execute('''
+            DELETE FROM file_info_cache WHERE rowid IN (
+                SELECT rowid FROM file_info_cache ORDER BY spilled_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (max_rows,))
+        
+        conn.commit()
+        conn.close()
+    
+    def load_file_info(self, key: Tuple[int, int, int, int]) -> Optional[Tuple[str, Optional[List[str]]]]:
+        """Get a spilled file-info cache entry."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT file_type, preview FROM file_info_cache
+            WHERE device = ? AND inode = ? AND file_size = ? AND mtime_ns = ?
+        ''', key)
+        
+        result = cursor.fetchone()
+        conn.close()
+        
+        if result:
+            return result[0], json.loads(result[1])
+        return None
+    
+    def has_file_info(self) -> bool:
+        """Check whether any file-info cache entries have been spilled."""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT 1 FROM file_info_cache LIMIT 1')
+        result = cursor.fetchone()
+        conn.close()
+        
+        return result is not None
+
+class QueryPlan:
+    """The backend chosen for a query together with the estimates behind it."""
+    def __init__(self, search_type: str, backend: str, estimates: Dict[str, float],
+                 tree_size: int, literal: str, selectivity: float):
+        self.search_type = search_type
+        self.backend = backend
+        self.estimates = estimates
+        self.tree_size = tree_size
+        self.literal = literal
+        self.selectivity = selectivity
+        self.actual_ms: Optional[float] = None
+
+    def explain(self) -> str:
+        """Describe the plan for display alongside the results."""
+        output = f"🧭 Query plan ({self.search_type}):\n"
+        output += f"  Backend: {self.backend}\n"
+        output += f"  Tree size: ~{self.tree_size:,} files\n"
+        if self.literal:
+            output += f"  Literal: {self.literal!r}\n"
+        output += f"  Selectivity: {self.selectivity:.4f}\n"
+        for backend, cost in sorted(self.estimates.items(), key=lambda x: x[1]):
+            marker = "→" if backend == self.backend else " "
+            output += f"  {marker} {backend}: est. {cost:.1f} ms\n"
+        if self.actual_ms is not None:
+            output += f"  Actual: {self.actual_ms:.1f} ms\n"
+        return output
+
+class QueryPlanner:
+    """Chooses the cheapest search backend per query and learns from actual costs."""
+
+    # (startup ms, per-file ms) for each search type and backend
+    BASE_COSTS = {
+        ('file_search', 'fd'): (6.0, 0.005),
+        ('file_search', 'python'): (0.5, 0.05),
+        ('content_search', 'ripgrep'): (8.0, 0.02),
+        ('content_search', 'python'): (0.5, 0.4),
+        ('regex_search', 'ripgrep'): (8.0, 0.02),
+        ('regex_search', 'python'): (0.5, 0.6),
+    }
+    # Backends that stop scanning once enough matches have been found
+    EARLY_EXIT = {
+        ('file_search', 'fd'),
+        ('content_search', 'ripgrep'),
+        ('content_search', 'python'),
+        ('regex_search', 'ripgrep'),
+        ('regex_search', 'python'),
+    }
+    # Bounds for the estimated fraction of files containing a literal
+    MIN_SELECTIVITY = 0.001
+    MAX_SELECTIVITY = 0.1
+    # The Python walker blocks the server while it runs, so it is only
+    # considered for trees up to this size when a native tool is available
+    PYTHON_MAX_TREE_SIZE = 1000
+
+    LEARNING_RATE = 0.2
+    TREE_SIZE_TTL = 300
+    TREE_SAMPLE_DIRS = 200
+
+    def __init__(self):
+        self.corrections = {key: 1.0 for key in self.BASE_COSTS}
+        self.tree_sizes: Dict[str, Tuple[int, float]] = {}
+
+    def estimate_tree_size(self, directory: Path) -> int:
+        """Estimate the number of files under a directory.
+
+        Walks at most TREE_SAMPLE_DIRS directories breadth-first and
+        extrapolates from the average directory size for the rest.
+        """
+        key = str(directory)
+        cached = self.tree_sizes.get(key)
+        if cached and time.time() - cached[1] < self.TREE_SIZE_TTL:
+            return cached[0]
+
+        files = 0
+        visited = 0
+        pending = [key]
+        while pending and visited < self.TREE_SAMPLE_DIRS:
+            current = pending.pop(0)
+            visited += 1
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            else:
+                                files += 1
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+        if pending:
+            files += int(len(pending) * files / max(visited, 1))
+
+        self.tree_sizes[key] = (files, time.time())
+        return files
+
+    @staticmethod
+    def extract_literal(pattern: str, is_regex: bool = False) -> str:
+        """Return the longest literal run that every match of the pattern must contain."""
+        if not is_regex:
+            return pattern
+
+        runs = []
+        current = ""
+        depth = 0
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if char == '\\' and i + 1 < len(pattern):
+                escaped = pattern[i + 1]
+                i += 2
+                if depth == 0 and not escaped.isalnum():
+                    current += escaped
+                else:
+                    runs.append(current)
+                    current = ""
+                continue
+            if char == '|' and depth == 0:
+                # Top-level alternation: no single literal is required
+                return ""
+            if char == '[':
+                # A character class matches one of several characters; brackets
+                # and parentheses inside it are literal
+                if depth == 0:
+                    runs.append(current)
+                    current = ""
+                i = QueryPlanner.skip_class(pattern, i)
+                continue
+            if char == '(':
+                depth += 1
+                runs.append(current)
+                current = ""
+            elif char == ')':
+                depth = max(depth - 1, 0)
+            elif char in '?*{' and depth == 0:
+                # The preceding character is optional or repeated
+                runs.append(current[:-1])
+                current = ""
+                if char == '{':
+                    closing = pattern.find('}', i)
+                    i = closing if closing != -1 else i
+            elif depth > 0:
+                pass
+            elif char == '+':
+                # The preceding character appears at least once
+                runs.append(current)
+                current = current[-1:]
+            elif char in '.^$':
+                runs.append(current)
+                current = ""
+            else:
+                current += char
+            i += 1
+        runs.append(current)
+        return max(runs, key=len)
+
+    @staticmethod
+    def skip_class(pattern: str, start: int) -> int:
+        """Return the index just past the character class opening at start.
+
+        A ']' right after the opening bracket (or '[^') is a literal, and
+        nested classes such as [[:alpha:]] are skipped as a whole.
+        """
+        i = start + 1
+        if pattern.startswith('^', i):
+            i += 1
+        if pattern.startswith(']', i):
+            i += 1
+        nesting = 1
+        while i < len(pattern):
+            char = pattern[i]
+            if char == '\\':
+                i += 2
+                continue
+            if char == '[':
+                nesting += 1
+            elif char == ']':
+                nesting -= 1
+                if nesting == 0:
+                    return i + 1
+            i += 1
+        return len(pattern)
+
+    @classmethod
+    def estimate_selectivity(cls, literal: str) -> float:
+        """Estimate the fraction of files that contain a literal.
+
+        Even short literals are assumed to be missing from most files, so a
+        rare literal doesn't send a large tree to a backend that only pays off
+        when it can stop early.
+        """
+        if not literal:
+            return 1.0
+        return min(cls.MAX_SELECTIVITY, max(cls.MIN_SELECTIVITY, 0.5 ** len(literal)))
+
+    def estimate_cost(self, search_type: str, backend: str, tree_size: int,
+                      selectivity: float, limit: int) -> float:
+        """Estimate the cost of running a search with a backend, in milliseconds."""
+        startup_ms, per_file_ms = self.BASE_COSTS[(search_type, backend)]
+        files = tree_size
+        if (search_type, backend) in self.EARLY_EXIT:
+            files = min(tree_size, limit / selectivity)
+        return self.corrections[(search_type, backend)] * (startup_ms + per_file_ms * files)
+
+    def plan(self, search_type: str, directory: Path, query: str, backends: List[str],
+             limit: int, is_regex: bool = False) -> QueryPlan:
+        """Pick the cheapest of the available backends for a query."""
+        tree_size = self.estimate_tree_size(directory)
+        literal = self.extract_literal(query, is_regex)
+        selectivity = self.estimate_selectivity(literal)
+
+        if tree_size > self.PYTHON_MAX_TREE_SIZE and len(backends) > 1:
+            backends = [backend for backend in backends if backend != 'python']
+        estimates = {
+            backend: self.estimate_cost(search_type, backend, tree_size, selectivity, limit)
+            for backend in backends
+        }
+        backend = min(estimates, key=estimates.get)
+        return QueryPlan(search_type, backend, estimates, tree_size, literal, selectivity)
+
+    def record(self, plan: QueryPlan, actual_ms: float):
+        """Refine the cost model with the measured cost of an executed plan."""
+        plan.actual_ms = actual_ms
+        key = (plan.search_type, plan.backend)
+        estimate = plan.estimates[plan.backend]
+        if estimate <= 0:
+            return
+
+        ratio = min(10.0, max(0.1, actual_ms / estimate))
+        self.corrections[key] *= ratio ** self.LEARNING_RATE
+        logger.debug(f"Planner {key}: estimated {estimate:.1f} ms, actual {actual_ms:.1f} ms")
+
+class IgnoreFilter:
+    """Selects the files the Python walker scans the way ripgrep does.
+
+    Hidden entries are skipped, as are entries matched by .ignore and .rgignore
+    files and, inside a git repository, by .gitignore files and
+    .git/info/exclude. Entries matched by an include glob are kept whatever
+    the ignore rules say; other files are skipped when there is one.
+    """
+
+    IGNORE_FILES = ('.ignore', '.rgignore')
+    # ripgrep treats a file as binary when this much of it contains a NUL byte
+    BINARY_SAMPLE = 64 * 1024
+
+    def __init__(self, root: Path, include: Optional[str] = None):
+        self.root = root
+        self.include = self.compile_glob(include) if include else None
+        self.dir_rules: Dict[Path, list] = {}
+        self.git_root = next(
+            (path for path in (root, *root.parents) if (path / '.git').exists()), None
+        )
+        # Rules from ignore files above the root still apply inside it
+        self.root_rules = []
+        if self.git_root is not None:
+            self.root_rules += self.load_rules(self.git_root, self.git_root / '.git' / 'info' / 'exclude')
+        for parent in reversed(root.parents):
+            self.root_rules += self.load_dir_rules(parent)
+
+    @staticmethod
+    def translate_glob(pattern: str) -> str:
+        """Translate a gitignore-style glob into a regular expression."""
+        output = ''
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if pattern.startswith('**/', i):
+                output += '(?:.*/)?'
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                output += '.*'
+                i += 2
+                continue
+            if char == '*':
+                output += '[^/]*'
+            elif char == '?':
+                output += '[^/]'
+            elif char == '[':
+                closing = pattern.find(']', i + 2)
+                if closing == -1:
+                    output += re.escape(char)
+                else:
+                    body = pattern[i + 1:closing]
+                    if body.startswith('!'):
+                        body = '^' + body[1:]
+                    output += '[' + body + ']'
+                    i = closing
+            elif char == '\\' and i + 1 < len(pattern):
+                i += 1
+                output += re.escape(pattern[i])
+            else:
+                output += re.escape(char)
+            i += 1
+        return output
+
+    @classmethod
+    def compile_glob(cls, pattern: str):
+        """Compile a glob matched against paths relative to where it applies.
+
+        Globs without a slash match the file name at any depth.
+        """
+        anchored = '/' in pattern.rstrip('/')
+        regex = cls.translate_glob(pattern.lstrip('/'))
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        return re.compile(regex + r'\Z')
+
+    @classmethod
+    def load_rules(cls, base: Path, ignore_file: Path) -> list:
+        """Parse an ignore file into (base, regex, negated, directories only) rules."""
+        try:
+            with open(ignore_file, 'r', encoding='utf-8', errors='ignore') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return []
+
+        rules = []
+        for line in lines:
+            line = line.rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            directories_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                rules.append((base, cls.compile_glob(line), negated, directories_only))
+        return rules
+
+    def load_dir_rules(self, directory: Path) -> list:
+        """Load the rules from the ignore files that apply to a directory."""
+        rules = []
+        if self.git_root is not None and directory.is_relative_to(self.git_root):
+            rules += self.load_rules(directory, directory / '.gitignore')
+        for name in self.IGNORE_FILES:
+            rules += self.load_rules(directory, directory / name)
+        return rules
+
+    @staticmethod
+    def ignored(path: Path, is_dir: bool, rules: list) -> bool:
+        """Apply ignore rules in order; the last matching rule wins."""
+        result = False
+        for base, regex, negated, directories_only in rules:
+            if directories_only and not is_dir:
+                continue
+            if regex.match(path.relative_to(base).as_posix()):
+                result = not negated
+        return result
+
+    def walk(self):
+        """Yield the files to scan under the root, in a stable order."""
+        pending = [(self.root, self.root_rules + self.load_dir_rules(self.root))]
+        while pending:
+            directory, rules = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = sorted(entries, key=lambda entry: entry.name)
+            except OSError:
+                continue
+
+            subdirectories = []
+            for entry in entries:
+                path = Path(entry.path)
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+
+                included = (self.include is not None
+                            and self.include.match(path.relative_to(self.root).as_posix()))
+                if not included and (entry.name.startswith('.') or self.ignored(path, is_dir, rules)):
+                    continue
+                if is_dir:
+                    subdirectories.append(path)
+                elif included or self.include is None:
+                    yield path
+
+            for path in reversed(subdirectories):
+                pending.append((path, rules + self.load_dir_rules(path)))
+
+    def excludes(self, path: Path, is_dir: bool = False) -> bool:
+        """Check whether walk() would skip a path under the root."""
+        rules = self.root_rules + self.cached_dir_rules(self.root)
+        current = self.root
+        parts = path.relative_to(self.root).parts
+        for index, part in enumerate(parts):
+            current = current / part
+            last = index == len(parts) - 1
+            if part.startswith('.') or self.ignored(current, is_dir or not last, rules):
+                return True
+            if not last:
+                rules = rules + self.cached_dir_rules(current)
+        return False
+
+    def cached_dir_rules(self, directory: Path) -> list:
+        rules = self.dir_rules.get(directory)
+        if rules is None:
+            rules = self.dir_rules[directory] = self.load_dir_rules(directory)
+        return rules
+
+class SearchDeadline:
+    """Latency budget for a single search."""
+    def __init__(self, deadline_ms: Optional[int], default_ms: int):
+        self.budget_ms = deadline_ms if deadline_ms else default_ms
+        self.expires_at = time.monotonic() + self.budget_ms / 1000
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Check whether the deadline has passed."""
+        return time.monotonic() >= self.expires_at
+
+class CommandStream:
+    """A running command whose output can be read across several requests."""
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+
+    @classmethod
+    async def start(cls, cmd: List[str], cwd: Path = None) -> 'CommandStream':
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            limit=16 * 1024 * 1024
+        )
+        return cls(process)
+
+    async def readline(self, timeout: float) -> Optional[str]:
+        """Return the next output line, or None once the command is done.
+
+        Raises asyncio.TimeoutError if no line arrives in time; nothing is
+        lost and the next call picks up the same line.
+        """
+        line = await asyncio.wait_for(self.process.stdout.readline(), timeout=timeout)
+        if not line:
+            return None
+        return line.decode('utf-8', errors='replace').rstrip('\n')
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+    async def close(self):
+        self.kill()
+        await self.process.wait()
+
+class SearchProgress:
+    """Tracks how far a search got so that a partial search can be resumed.
+
+    Native tools that ran out of time stay alive in stream, paused on their
+    full output pipe, and a resumed search keeps reading from them. Files
+    they already reported are tracked as well. The Python walkers visit files
+    in a stable order, so their progress is a position in that walk.
+    """
+    def __init__(self, query_key: str, backend: str):
+        self.query_key = query_key
+        self.backend = backend
+        self.done_files = set()
+        self.last_lines: Dict[str, int] = {}
+        self.position = 0
+        self.partial = False
+        self.stream: Optional[CommandStream] = None
+
+    def discard(self):
+        """Stop a native tool kept alive for resuming."""
+        if self.stream is not None:
+            self.stream.kill()
+            self.stream = None
+
+    def skip_match(self, file_path: str, line_number: int = 0) -> bool:
+        """Check whether a match was already returned before the search was resumed."""
+        if file_path in self.done_files:
+            return True
+        return line_number <= self.last_lines.get(file_path, 0)
+
+    def note_match(self, file_path: str, line_number: int):
+        """Record a returned match in a file that may not be finished yet."""
+        self.last_lines[file_path] = line_number
+
+    def finish_file(self, file_path: str):
+        """Record that every match in a file has been returned."""
+        self.done_files.add(file_path)
+        self.last_lines.pop(file_path, None)
+
+class CachedFile:
+    """Text of a file together with its line-offset table."""
+    def __init__(self, stamp: Tuple[int, int], text: str):
+        self.stamp = stamp
+        self.text = text
+        self.offsets = array('L', [0])
+        for match in re.finditer('\n', text):
+            self.offsets.append(match.end())
+        if self.offsets[-1] != len(text):
+            self.offsets.append(len(text))
+
+    @property
+    def line_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def size(self) -> int:
+        return len(self.text) + self.offsets.itemsize * len(self.offsets)
+
+    def line(self, line_number: int) -> str:
+        """Return a 1-based line including its line ending."""
+        return self.text[self.offsets[line_number - 1]:self.offsets[line_number]]
+
+    def lines(self, start: int = 1, end: int = None):
+        """Yield the lines from start to end (1-based, inclusive)."""
+        end = self.line_count if end is None else min(end, self.line_count)
+        for line_number in range(max(start, 1), end + 1):
+            yield self.line(line_number)
+
+class LineCache:
+    """Bounded LRU cache of recently scanned files, used to serve context lines.
+
+    Entries are validated against the file's mtime and size on every access,
+    so edited files are reloaded rather than served stale.
+    """
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, max_file_bytes: int = 2 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.entries: OrderedDict = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        # The Python walker fills the cache from a worker thread
+        self.lock = threading.RLock()
+
+    def load(self, file_path: str) -> Optional[CachedFile]:
+        """Return the cached file, reading it from disk if needed.
+
+        Returns None for files that are unreadable or too large to cache.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+
+        with self.lock:
+            entry = self.entries.get(file_path)
+            if entry is not None and entry.stamp == stamp:
+                self.entries.move_to_end(file_path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        if stat.st_size > self.max_file_bytes:
+            return None
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                entry = CachedFile(stamp, f.read())
+        except OSError:
+            return None
+
+        self.put(file_path, entry)
+        return entry
+
+    def put(self, file_path: str, entry: CachedFile):
+        """Add an entry, evicting the least recently used ones over the budget."""
+        with self.lock:
+            previous = self.entries.pop(file_path, None)
+            if previous is not None:
+                self.size -= previous.size
+            self.entries[file_path] = entry
+            self.size += entry.size
+            self.trim(self.max_bytes)
+
+    def trim(self, max_bytes: int):
+        """Evict least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            while self.size > max_bytes and self.entries:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def iter_lines(self, file_path: str):
+        """Yield the lines of a file, from the cache when it fits in it."""
+        entry = self.load(file_path)
+        if entry is not None:
+            yield from entry.lines()
+            return
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            yield from f
+
+    def context(self, file_path: str, line_number: int, before: int,
+                after: int) -> Tuple[List[str], Optional[str], List[str]]:
+        """Return the lines before, at and after a line of a file."""
+        start = max(line_number - before, 1)
+        entry = self.load(file_path)
+        if entry is not None:
+            lines = [line.rstrip('\r\n') for line in entry.lines(start, line_number + after)]
+        else:
+            # Too large to cache: stream the window from disk
+            try:
+                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                    lines = [line.rstrip('\r\n') for line in
+                             itertools.islice(f, start - 1, line_number + after)]
+            except OSError:
+                return [], None, []
+
+        split = line_number - start
+        if split >= len(lines):
+            return lines, None, []
+        return lines[:split], lines[split], lines[split + 1:]
+
+class FileInfoCache:
+    """Caches MIME types and content previews by file identity.
+
+    Keys are (device, inode, size, mtime), so an unchanged file is never
+    sniffed twice while a modified one gets a fresh entry. Entries spilled to
+    the indexer under memory pressure are still found there, and move back
+    into memory when used. Safe to use from worker threads.
+    """
+    # Spilled entries are dropped after SPILL_MAX_AGE seconds, oldest first beyond MAX_SPILLED
+    SPILL_MAX_AGE = 7 * 24 * 3600.0
+    MAX_SPILLED = 100000
+
+    def __init__(self, max_entries: int = 4096, indexer: Optional[FileIndexer] = None):
+        self.max_entries = max_entries
+        self.indexer = indexer
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        # Only look in the indexer once something has been spilled there
+        self.spilled = indexer is not None and indexer.has_file_info()
+
+    @staticmethod
+    def key(stat: os.stat_result) -> Tuple[int, int, int, int]:
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, key: Tuple[int, int, int, int]) -> Optional[Tuple[str, Optional[List[str]]]]:
+        """Return the cached (file type, preview lines) for a file."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                return entry
+        
+        if not self.spilled:
+            return None
+        entry = self.indexer.load_file_info(key)
+        if entry is not None:
+            self.put(key, *entry)
+        return entry
+
+    def put(self, key: Tuple[int, int, int, int], file_type: str, preview: Optional[List[str]]):
+        """Cache the file type and preview lines for a file."""
+        with self.lock:
+            self.entries[key] = (file_type, preview)
+            self.entries.move_to_end(key)
+        self.trim(self.max_entries)
+
+    def trim(self, max_entries: int, spill: bool = False):
+        """Evict least recently used entries until at most max_entries remain.
+        
+        With spill set, evicted entries are written to the indexer first.
+        """
+        with self.lock:
+            evicted = []
+            while len(self.entries) > max_entries:
+                evicted.append(self.entries.popitem(last=False))
+        
+        if spill and evicted and self.indexer is not None:
+            self.indexer.spill_file_info(evicted, self.SPILL_MAX_AGE, self.MAX_SPILLED)
+            self.spilled = True
+
+class ContainerLimits:
+    """CPU and memory limits of the cgroup the server runs in.
+
+    Reads cgroup v2 files and falls back to cgroup v1. A reading is None when
+    there is no limit or no cgroup filesystem, and callers then fall back to
+    what psutil reports for the host.
+    """
+
+    ROOT = Path('/sys/fs/cgroup')
+    # cgroup v1 reports "no memory limit" as a huge page-aligned number
+    UNLIMITED = 2 ** 60
+
+    def __init__(self, root: Path = ROOT):
+        self.root = root
+        # Controller ('' for cgroup v2) -> the server's cgroup path
+        self.paths: Dict[str, str] = {}
+        try:
+            with open('/proc/self/cgroup') as f:
+                for line in f:
+                    _, controllers, path = line.rstrip('\n').split(':', 2)
+                    for controller in controllers.split(',') if controllers else ['']:
+                        self.paths[controller] = path
+        except (OSError, ValueError):
+            pass
+
+    def read(self, controller: str, name: str) -> Optional[str]:
+        """Read a file of the server's cgroup, or of the hierarchy root inside a cgroup namespace."""
+        base = self.root / controller if controller else self.root
+        relative = self.paths.get(controller, '/').lstrip('/')
+        for directory in (base / relative, base):
+            try:
+                return (directory / name).read_text().strip()
+            except OSError:
+                continue
+        return None
+
+    def cpu_limit(self) -> Optional[float]:
+        """Number of CPUs the cgroup's quota allows, e.g. 0.5."""
+        try:
+            value = self.read('', 'cpu.max')
+            if value is not None:
+                quota, _, period = value.partition(' ')
+                return None if quota == 'max' else int(quota) / int(period or 100000)
+            quota = self.read('cpu', 'cpu.cfs_quota_us')
+            period = self.read('cpu', 'cpu.cfs_period_us')
+            if quota and period and int(quota) > 0:
+                return int(quota) / int(period)
+        except ValueError:
+            pass
+        return None
+
+    def memory_limit(self) -> Optional[int]:
+        """The cgroup's memory limit in bytes."""
+        value = self.read('', 'memory.max') or self.read('memory', 'memory.limit_in_bytes')
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            return None
+        return limit if limit < self.UNLIMITED else None
+
+    def cpu_usage(self) -> Optional[Tuple[float, int, int]]:
+        """CPU seconds used by the cgroup, with its scheduler periods and throttled periods."""
+        stat = self.read('', 'cpu.stat')
+        usage = None
+        if stat is None:
+            stat = self.read('cpu', 'cpu.stat')
+            usage = self.read('cpuacct', 'cpuacct.usage')
+        if stat is None:
+            return None
+        fields = dict(line.split(' ', 1) for line in stat.splitlines() if ' ' in line)
+        try:
+            seconds = int(usage) / 1e9 if usage else int(fields['usage_usec']) / 1e6
+            return seconds, int(fields.get('nr_periods', 0)), int(fields.get('nr_throttled', 0))
+        except (KeyError, ValueError):
+            return None
+
+class ResourceGovernor:
+    """Keeps the server inside its memory and CPU budget.
+
+    Every request takes a slot. The number of slots shrinks as memory use
+    approaches the budget or the load average rises. Above SOFT_LIMIT of the
+    budget the caches are shrunk and spilled to disk, idle similarity
+    indexes are unloaded and native tools paused behind resume cursors are
+    stopped; above the budget the caches are emptied and
+    requests run one at a time until memory is back under it.
+
+    Memory use is the anonymous memory of the process and its child
+    processes where psutil reports it (RSS minus file-backed pages), so
+    memory-mapped index segments, which the kernel can drop on its own,
+    don't count against the budget.
+
+    Inside a container, the CPU count, load and default memory budget come
+    from the cgroup's limits rather than from the host. With a CPU quota,
+    load is the share of the quota used since the last sample plus the share
+    of scheduler periods in which the cgroup was throttled, so it exceeds 1
+    only when the server wants more CPU than it is allowed.
+    """
+
+    SOFT_LIMIT = 0.75
+    # Default memory budget: this share of the container's memory limit, at
+    # most DEFAULT_BUDGET_MB; the rest is left for rg/fd and the page cache
+    LIMIT_SHARE = 0.6
+    DEFAULT_BUDGET_MB = 384
+    # Share of the memory budget the in-memory caches may use
+    CACHE_SHARE = 0.25
+    SAMPLE_INTERVAL = 1.0
+    # Freed memory often stays with the process, so caches aren't shed more often than this
+    RELIEVE_INTERVAL = 10.0
+    SLOT_TIMEOUT = 30.0
+
+    def __init__(self, memory_budget_mb: Optional[int] = None, max_concurrent: int = 4,
+                 limits: Optional[ContainerLimits] = None):
+        self.limits = limits or ContainerLimits()
+        self.process = psutil.Process()
+        if memory_budget_mb is None:
+            memory_budget_mb = self.default_budget_mb()
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.max_concurrent = max(1, max_concurrent)
+        self.cpu_limit = self.limits.cpu_limit()
+        self.cpu_count = self.host_cpu_count()
+        if self.cpu_limit:
+            self.cpu_count = max(1, min(self.cpu_count, math.ceil(self.cpu_limit)))
+        self.cpu_sample: Optional[Tuple[float, float, int, int]] = None
+        self.active = 0
+        self.condition = asyncio.Condition()
+        self.line_cache: Optional[LineCache] = None
+        self.file_info_cache: Optional[FileInfoCache] = None
+        self.similarity_indexes: Dict[str, 'SimilarityIndex'] = {}
+        self.cursors: Dict[str, SearchProgress] = {}
+        self.memory = 0
+        self.load = 0.0
+        self.sampled_at = 0.0
+        self.relieved_at = 0.0
+
+    def default_budget_mb(self) -> int:
+        """Memory budget for a container's memory limit, or for the host's memory."""
+        limit = self.limits.memory_limit() or psutil.virtual_memory().total
+        return min(self.DEFAULT_BUDGET_MB, int(limit * self.LIMIT_SHARE) // (1024 * 1024))
+
+    def host_cpu_count(self) -> int:
+        """CPUs the process may run on, honouring cpusets."""
+        try:
+            return len(self.process.cpu_affinity()) or 1
+        except (AttributeError, psutil.Error, OSError):
+            return psutil.cpu_count() or 1
+
+    @property
+    def cache_budget(self) -> int:
+        return int(self.memory_budget * self.CACHE_SHARE)
+
+    def govern_caches(self, line_cache: LineCache, file_info_cache: FileInfoCache):
+        """Put the in-memory caches under the governor's budget."""
+        self.line_cache = line_cache
+        self.file_info_cache = file_info_cache
+        # The budget only ever shrinks the caches below their defaults
+        line_cache.max_bytes = min(line_cache.max_bytes, self.cache_budget)
+        line_cache.trim(line_cache.max_bytes)
+
+    def govern_similarity_indexes(self, similarity_indexes: Dict[str, 'SimilarityIndex']):
+        """Let the governor unload similarity indexes under memory pressure."""
+        self.similarity_indexes = similarity_indexes
+
+    def govern_cursors(self, cursors: Dict[str, SearchProgress]):
+        """Let the governor stop the native tools paused behind resume cursors."""
+        self.cursors = cursors
+
+    def sample(self, force: bool = False):
+        """Refresh the memory and per-CPU load readings."""
+        now = time.monotonic()
+        if not force and now - self.sampled_at < self.SAMPLE_INTERVAL:
+            return
+        self.sampled_at = now
+        try:
+            # Paused rg/fd processes count too; they share the container's limit
+            memory = 0
+            for process in [self.process, *self.process.children(recursive=True)]:
+                with contextlib.suppress(psutil.NoSuchProcess):
+                    info = process.memory_info()
+                    # Linux reports file-backed resident pages as shared
+                    memory += info.rss - getattr(info, 'shared', 0)
+            self.memory = memory
+            usage = self.limits.cpu_usage() if self.cpu_limit else None
+            if usage is not None:
+                self.load = self.cgroup_load(now, usage)
+            else:
+                self.load = psutil.getloadavg()[0] / self.cpu_count
+        except (psutil.Error, OSError) as e:
+            logger.debug(f"Resource sampling failed: {e}")
+
+    def cgroup_load(self, now: float, usage: Tuple[float, int, int]) -> float:
+        """Load relative to the cgroup's CPU quota since the previous reading."""
+        if self.cpu_sample is None:
+            self.cpu_sample = (now, *usage)
+            return 0.0
+        sampled_at, seconds, periods, throttled = self.cpu_sample
+        if now - sampled_at < self.SAMPLE_INTERVAL:
+            return self.load
+        self.cpu_sample = (now, *usage)
+        used = (usage[0] - seconds) / ((now - sampled_at) * self.cpu_limit)
+        periods = usage[1] - periods
+        return used + ((usage[2] - throttled) / periods if periods > 0 else 0.0)
+
+    @property
+    def pressure(self) -> float:
+        """Memory use as a fraction of the memory budget."""
+        return self.memory / self.memory_budget
+
+    def concurrency_limit(self) -> int:
+        """Number of requests allowed to run at once under current pressure."""
+        limit = self.max_concurrent
+        if self.pressure > 1.0:
+            return 1
+        if self.pressure > self.SOFT_LIMIT:
+            limit = limit // 2
+        if self.load > 1.0:
+            limit = int(limit / self.load)
+        return max(1, limit)
+
+    def worker_limit(self, requested: int) -> int:
+        """Number of worker threads a parallel task may use under current pressure."""
+        self.sample()
+        workers = min(requested, self.cpu_count)
+        if self.pressure > self.SOFT_LIMIT or self.load > 1.0:
+            workers = workers // 2
+        return max(1, workers)
+
+    def batch_bytes(self, requested: int) -> int:
+        """Bytes a task may buffer before writing them out under current pressure."""
+        self.sample()
+        headroom = int(self.memory_budget * self.SOFT_LIMIT) - self.memory
+        return max(1024 * 1024, min(requested, headroom // 2))
+
+    def relieve_pressure(self):
+        """Shrink or spill caches when memory use is above the soft limit."""
+        if self.pressure <= self.SOFT_LIMIT:
+            return
+        if time.monotonic() - self.relieved_at < self.RELIEVE_INTERVAL:
+            return
+        self.relieved_at = time.monotonic()
+
+        logger.warning(f"Memory pressure: {self.memory / 1024 / 1024:.0f} MB of "
+                       f"{self.memory_budget / 1024 / 1024:.0f} MB; shrinking caches")
+        severe = self.pressure > 1.0
+        if self.line_cache is not None:
+            self.line_cache.trim(0 if severe else self.line_cache.max_bytes // 4)
+        if self.file_info_cache is not None:
+            self.file_info_cache.trim(0 if severe else self.file_info_cache.max_entries // 4, spill=True)
+        for index in list(self.similarity_indexes.values()):
+            index.unload()
+        # Cursors stay valid; a resumed search restarts its tool and skips what it returned
+        for progress in list(self.cursors.values()):
+            progress.discard()
+        gc.collect()
+        self.sample(force=True)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one of the adaptive request slots while a request runs."""
+        self.sample()
+        self.relieve_pressure()
+
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.active < self.concurrency_limit()),
+                    timeout=self.SLOT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"Server is busy ({self.active} requests running); retry shortly")
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.active -= 1
+                self.sample()
+                self.condition.notify_all()
+
+class SimilaritySegment:
+    """An immutable block of chunk vectors in CSR form, memory-mapped from disk."""
+
+    # Rows scored per vectorized batch
+    BLOCK_ROWS = 8192
+
+    def __init__(self, segment_id: int, directory: Path, chunks: List[List]):
+        self.segment_id = segment_id
+        self.directory = directory
+        self.chunks = chunks
+        self.indptr = np.load(self.path('indptr'), mmap_mode='r')
+        self.indices = np.load(self.path('indices'), mmap_mode='r')
+        self.data = np.load(self.path('data'), mmap_mode='r')
+        self.alive = np.ones(len(chunks), dtype=bool)
+        self.norms = None
+        self.norms_version = -1
+
+    def path(self, name: str) -> Path:
+        return self.directory / f"segment-{self.segment_id}-{name}.npy"
+
+    @classmethod
+    def write(cls, segment_id: int, directory: Path, chunks: List[List],
+              indptr: 'np.ndarray', indices: 'np.ndarray', data: 'np.ndarray') -> 'SimilaritySegment':
+        """Save CSR arrays for a new segment and map them back in."""
+        for name, values in (('indptr', indptr), ('indices', indices), ('data', data)):
+            np.save(directory / f"segment-{segment_id}-{name}.npy", values)
+        return cls(segment_id, directory, chunks)
+
+    @property
+    def nbytes(self) -> int:
+        return self.indices.nbytes + self.data.nbytes
+
+    def delete(self):
+        """Remove the segment's files."""
+        for name in ('indptr', 'indices', 'data'):
+            with contextlib.suppress(OSError):
+                self.path(name).unlink()
+
+    def row_indices(self, row: int) -> 'np.ndarray':
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def alive_indices(self) -> 'np.ndarray':
+        """Term indices of every live row, for document-frequency counts."""
+        rows = np.repeat(np.arange(len(self.chunks)), np.diff(self.indptr))
+        return self.indices[self.alive[rows]]
+
+    def weighted_sums(self, weights: 'np.ndarray') -> 'np.ndarray':
+        """Sum data * weights[indices] per row, one block of rows at a time."""
+        sums = np.empty(len(self.chunks), dtype=np.float32)
+        for start in range(0, len(self.chunks), self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, len(self.chunks))
+            low, high = self.indptr[start], self.indptr[end]
+            values = self.data[low:high] * weights[self.indices[low:high]]
+            # Rows are never empty, so every offset is a valid reduceat start
+            sums[start:end] = np.add.reduceat(values, self.indptr[start:end] - low)
+        return sums
+
+    def score(self, query: 'np.ndarray', idf: 'np.ndarray', version: int) -> 'np.ndarray':
+        """Cosine similarity of every row against a normalized query vector."""
+        if self.norms_version != version:
+            squared = np.empty(len(self.chunks), dtype=np.float32)
+            for start in range(0, len(self.chunks), self.BLOCK_ROWS):
+                end = min(start + self.BLOCK_ROWS, len(self.chunks))
+                low, high = self.indptr[start], self.indptr[end]
+                values = self.data[low:high] * idf[self.indices[low:high]]
+                squared[start:end] = np.add.reduceat(values * values, self.indptr[start:end] - low)
+            self.norms = np.sqrt(squared)
+            self.norms_version = version
+
+        scores = self.weighted_sums(idf * query) / np.maximum(self.norms, 1e-12)
+        scores[~self.alive] = 0.0
+        return scores
+
+class SimilarityIndex:
+    """Offline TF-IDF similarity index over fixed-size chunks of the files under a root.
+
+    Chunks are hashed into a sparse term space and stored as CSR segments in
+    memory-mapped .npy files. A changed file retires its old rows and its new
+    chunks land in a fresh segment; segments are compacted once most of their
+    rows are dead. IDF weights are applied at query time, so updates never
+    rewrite existing rows. New and compacted segments are written in batches
+    of at most BATCH_BYTES (less under memory pressure), and the file walk
+    resumes where it stopped when it runs out of time.
+    """
+
+    DIMENSIONS = 2 ** 18
+    CHUNK_LINES = 40
+    MAX_FILE_BYTES = 1024 * 1024
+    REFRESH_INTERVAL = 30.0
+    MAX_SEGMENTS = 16
+    BATCH_BYTES = 16 * 1024 * 1024
+    MAX_WORKERS = 4
+    IDENTIFIER_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9_]*')
+    WORD_PATTERN = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+')
+
+    def __init__(self, root: Path, storage_dir: Path):
+        self.root = root
+        self.storage_dir = storage_dir
+        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.reset()
+
+    def ensure_loaded(self):
+        """Map in the saved index on first use or after it was unloaded."""
+        if self.loaded:
+            return
+        self.reset()
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Discarding similarity index for {self.root}: {e}")
+            self.clear()
+        self.loaded = True
+
+    def unload(self):
+        """Release the in-memory index; it is mapped in again from disk when next used."""
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.loaded:
+                self.reset()
+                self.loaded = False
+        finally:
+            self.lock.release()
+
+    def reset(self):
+        """Start with an empty index in memory."""
+        self.segments: Dict[int, SimilaritySegment] = {}
+        self.files: Dict[str, Dict[str, List]] = {}
+        self.df = np.zeros(self.DIMENSIONS, dtype=np.int64)
+        self.alive_rows = 0
+        self.next_segment_id = 0
+        self.version = 0
+        self.pending_files = 0
+        self.refreshed_at = 0.0
+        # The unfinished file walk and the stamps it found so far
+        self.walk: Optional[Tuple[Any, Dict[str, List[int]]]] = None
+
+    def clear(self):
+        """Delete the index from memory and disk."""
+        for segment in self.segments.values():
+            segment.delete()
+        with contextlib.suppress(OSError):
+            (self.storage_dir / 'manifest.json').unlink()
+        self.reset()
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        """Split text into lowercase identifiers and their snake/camel-case words."""
+        tokens = []
+        for identifier in cls.IDENTIFIER_PATTERN.findall(text):
+            words = [word.lower() for word in cls.WORD_PATTERN.findall(identifier)]
+            tokens.extend(word for word in words if len(word) > 1)
+            if len(words) > 1:
+                tokens.append(identifier.lower())
+        return tokens
+
+    def vectorize(self, text: str) -> Optional[Tuple['np.ndarray', 'np.ndarray']]:
+        """Hash text into sorted term indices and log-scaled term frequencies."""
+        tokens = self.tokenize(text)
+        if not tokens:
+            return None
+        hashes = np.fromiter((zlib.crc32(token.encode()) for token in tokens),
+                             dtype=np.uint32, count=len(tokens))
+        indices, counts = np.unique(hashes % self.DIMENSIONS, return_counts=True)
+        return indices.astype(np.int32), (1.0 + np.log(counts)).astype(np.float32)
+
+    def vectorize_file(self, file_path: str) -> List[Tuple[int, int, 'np.ndarray', 'np.ndarray']]:
+        """Split a text file into chunks and vectorize each one."""
+        try:
+            with open(file_path, 'rb') as f:
+                raw = f.read(self.MAX_FILE_BYTES + 1)
+        except OSError:
+            return []
+        if len(raw) > self.MAX_FILE_BYTES or b'\0' in raw[:IgnoreFilter.BINARY_SAMPLE]:
+            return []
+
+        lines = raw.decode('utf-8', errors='ignore').split('\n')
+        chunks = []
+        for start in range(0, len(lines), self.CHUNK_LINES):
+            end = min(start + self.CHUNK_LINES, len(lines))
+            vector = self.vectorize('\n'.join(lines[start:end]))
+            if vector is not None:
+                chunks.append((start + 1, end, *vector))
+        return chunks
+
+    def scan_files(self, deadline: SearchDeadline) -> Optional[Dict[str, List[int]]]:
+        """Map every indexable file under the root to its [mtime_ns, size] stamp.
+
+        Files are selected like the other searches select them: hidden and
+        ignored files are skipped. The walk stops at the deadline and
+        continues where it left off on the next call. Returns None until the
+        walk is complete.
+        """
+        if self.walk is None:
+            self.walk = (IgnoreFilter(self.root).walk(), {})
+        files, stamps = self.walk
+        for file_path in files:
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            if stat.st_size <= self.MAX_FILE_BYTES:
+                stamps[str(file_path)] = [stat.st_mtime_ns, stat.st_size]
+            if deadline.expired():
+                return None
+        self.walk = None
+        return stamps
+
+    def retire(self, file_path: str):
+        """Drop a file's rows from the index."""
+        entry = self.files.pop(file_path, None)
+        if not entry:
+            return
+        for segment_id, row in entry['rows']:
+            segment = self.segments[segment_id]
+            if segment.alive[row]:
+                segment.alive[row] = False
+                np.subtract.at(self.df, segment.row_indices(row), 1)
+                self.alive_rows -= 1
+
+    def refresh(self, deadline: SearchDeadline, workers: int, batch_bytes: int = None) -> int:
+        """Bring the index up to date with the files on disk.
+
+        Files are vectorized in worker threads until the deadline passes, and
+        their chunks are written out whenever batch_bytes have accumulated.
+        Returns the number of changed files that are still waiting, or of
+        files found so far when the walk is unfinished.
+        """
+        batch_bytes = batch_bytes or self.BATCH_BYTES
+        with self.lock:
+            self.ensure_loaded()
+            recent = time.monotonic() - self.refreshed_at < self.REFRESH_INTERVAL
+            if recent and not self.pending_files and self.walk is None:
+                return 0
+
+            stamps = self.scan_files(deadline)
+            if stamps is None:
+                self.pending_files = len(self.walk[1])
+                return self.pending_files
+
+            changed = False
+            for file_path in list(self.files):
+                if file_path not in stamps:
+                    self.retire(file_path)
+                    changed = True
+            stale = [path for path, stamp in stamps.items()
+                     if self.files.get(path, {}).get('stamp') != stamp]
+
+            batch = self.new_batch()
+            indexed = 0
+            queue = iter(stale)
+            running = {}
+            pool = ThreadPoolExecutor(max_workers=workers)
+            try:
+                while not deadline.expired():
+                    # Keep a bounded number of files in flight so results don't pile up
+                    for file_path in itertools.islice(queue, workers * 2 - len(running)):
+                        running[pool.submit(self.vectorize_file, file_path)] = file_path
+                    if not running:
+                        break
+                    done, _ = futures_wait(running, timeout=deadline.remaining(),
+                                           return_when=FIRST_COMPLETED)
+                    for future in done:
+                        file_path = running.pop(future)
+                        self.retire(file_path)
+                        self.add_to_batch(batch, file_path, stamps[file_path], future.result())
+                        indexed += 1
+                    if batch['bytes'] >= batch_bytes:
+                        self.flush_batch(batch)
+                        batch = self.new_batch()
+                if running or next(queue, None) is not None:
+                    logger.info(f"Similarity indexing of {self.root} reached its deadline")
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
+            # Files that were already being vectorized at the deadline still count
+            for future, file_path in running.items():
+                if not future.cancelled() and future.exception() is None:
+                    self.retire(file_path)
+                    self.add_to_batch(batch, file_path, stamps[file_path], future.result())
+                    indexed += 1
+            self.flush_batch(batch)
+
+            self.pending_files = len(stale) - indexed
+            if changed or indexed:
+                self.compact(batch_bytes)
+                self.version += 1
+                self.save()
+            self.refreshed_at = time.monotonic()
+            return self.pending_files
+
+    @staticmethod
+    def new_batch() -> Dict[str, Any]:
+        return {'chunks': [], 'indptr': [0], 'indices': [], 'data': [], 'files': {}, 'bytes': 0}
+
+    @staticmethod
+    def add_to_batch(batch: Dict[str, Any], file_path: str, stamp: List[int], chunks: List):
+        """Queue a file's vectorized chunks for the next segment."""
+        rows = []
+        for start, end, row_indices, row_data in chunks:
+            rows.append(len(batch['chunks']))
+            batch['chunks'].append([file_path, start, end])
+            batch['indices'].append(row_indices)
+            batch['data'].append(row_data)
+            batch['indptr'].append(batch['indptr'][-1] + len(row_indices))
+            batch['bytes'] += row_indices.nbytes + row_data.nbytes
+        batch['files'][file_path] = (stamp, rows)
+
+    def flush_batch(self, batch: Dict[str, Any]):
+        """Write a batch as a new segment and point its files at their rows."""
+        segment_id = self.next_segment_id
+        if batch['chunks']:
+            segment = SimilaritySegment.write(
+                segment_id, self.storage_dir, batch['chunks'],
+                np.array(batch['indptr'], dtype=np.int64),
+                np.concatenate(batch['indices']), np.concatenate(batch['data'])
+            )
+            self.segments[segment_id] = segment
+            self.next_segment_id += 1
+            self.df += np.bincount(segment.indices, minlength=self.DIMENSIONS)
+            self.alive_rows += len(batch['chunks'])
+        for file_path, (stamp, rows) in batch['files'].items():
+            self.files[file_path] = {
+                'stamp': stamp,
+                'rows': [[segment_id, row] for row in rows],
+            }
+
+    def compact(self, max_bytes: int):
+        """Rewrite mostly-dead segments and merge small ones while there are too many.
+
+        Merged segments stay under max_bytes, so compaction never holds more
+        than that in memory.
+        """
+        groups = [[segment] for segment in self.segments.values()
+                  if int(segment.alive.sum()) * 2 < len(segment.chunks)]
+        rewritten = {segment.segment_id for group in groups for segment in group}
+        remaining = len(self.segments)
+
+        # Merge the smallest segments while there are more than MAX_SEGMENTS
+        candidates = sorted((segment for segment in self.segments.values()
+                             if segment.segment_id not in rewritten), key=lambda segment: segment.nbytes)
+        while remaining > self.MAX_SEGMENTS and len(candidates) > 1:
+            group, group_bytes = [], 0
+            while candidates and group_bytes + candidates[0].nbytes <= max_bytes:
+                group_bytes += candidates[0].nbytes
+                group.append(candidates.pop(0))
+            if len(group) < 2:
+                break
+            groups.append(group)
+            remaining -= len(group) - 1
+
+        for group in groups:
+            self.merge_segments(group)
+
+    def merge_segments(self, group: List[SimilaritySegment]):
+        """Write the live rows of some segments into one new segment."""
+        chunks, indptr, indices, data = [], [0], [], []
+        moved = {}
+        for segment in group:
+            for row in np.flatnonzero(segment.alive):
+                low, high = segment.indptr[row], segment.indptr[row + 1]
+                moved[(segment.segment_id, int(row))] = len(chunks)
+                chunks.append(segment.chunks[row])
+                indices.append(np.asarray(segment.indices[low:high]))
+                data.append(np.asarray(segment.data[low:high]))
+                indptr.append(indptr[-1] + int(high - low))
+
+        segment_id = self.next_segment_id
+        if chunks:
+            self.segments[segment_id] = SimilaritySegment.write(
+                segment_id, self.storage_dir, chunks,
+                np.array(indptr, dtype=np.int64), np.concatenate(indices), np.concatenate(data)
+            )
+            self.next_segment_id += 1
+        for file_entry in self.files.values():
+            file_entry['rows'] = [
+                [segment_id, moved[(row_segment, row)]] if (row_segment, row) in moved else [row_segment, row]
+                for row_segment, row in file_entry['rows']
+            ]
+        for segment in group:
+            del self.segments[segment.segment_id]
+            segment.delete()
+
+    def save(self):
+        """Write the manifest describing segments and indexed files."""
+        manifest = {
+            'next_segment_id': self.next_segment_id,
+            'segments': {str(segment_id): segment.chunks for segment_id, segment in self.segments.items()},
+            'files': self.files,
+        }
+        manifest_path = self.storage_dir / 'manifest.json'
+        temp_path = manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, manifest_path)
+
+    def load(self):
+        """Map in the segments of a previously saved index."""
+        manifest_path = self.storage_dir / 'manifest.json'
+        if not manifest_path.exists():
+            return
+
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        self.next_segment_id = manifest['next_segment_id']
+        self.files = manifest['files']
+        for segment_id, chunks in manifest['segments'].items():
+            segment = SimilaritySegment(int(segment_id), self.storage_dir, chunks)
+            segment.alive[:] = False
+            self.segments[segment.segment_id] = segment
+        for file_entry in self.files.values():
+            for segment_id, row in file_entry['rows']:
+                self.segments[segment_id].alive[row] = True
+        for segment in self.segments.values():
+            self.df += np.bincount(segment.alive_indices(), minlength=self.DIMENSIONS)
+            self.alive_rows += int(segment.alive.sum())
+
+    def query(self, text: str, limit: int) -> List[Tuple[float, str, int, int]]:
+        """Return the top chunks by cosine similarity as (score, path, start, end)."""
+        with self.lock:
+            self.ensure_loaded()
+            vector = self.vectorize(text)
+            if vector is None or not self.alive_rows:
+                return []
+
+            idf = (np.log((1.0 + self.alive_rows) / (1.0 + self.df)) + 1.0).astype(np.float32)
+            query_indices, query_tf = vector
+            query = np.zeros(self.DIMENSIONS, dtype=np.float32)
+            query[query_indices] = query_tf * idf[query_indices]
+            query /= np.linalg.norm(query)
+
+            candidates = []
+            for segment in self.segments.values():
+                scores = segment.score(query, idf, self.version)
+                k = min(limit, len(scores))
+                for row in np.argpartition(-scores, k - 1)[:k]:
+                    if scores[row] > 0:
+                        candidates.append((float(scores[row]), segment, int(row)))
+
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            return [(score, *segment.chunks[row]) for score, segment, row in candidates[:limit]]
+
+class ChangeHandler(FileSystemEventHandler):
+    """Forwards file system events under a watched directory to the cache warmer.
+
+    Changes searches can't see, such as hidden (.git) or ignored
+    (node_modules) files, are dropped, and so are changes to the cache itself.
+    """
+
+    CHANGE_EVENTS = {'created', 'deleted', 'modified', 'moved'}
+
+    def __init__(self, warmer: 'CacheWarmer', loop: asyncio.AbstractEventLoop,
+                 root: Path, cache_dir: Path):
+        self.warmer = warmer
+        self.loop = loop
+        self.root = root
+        self.cache_dir = cache_dir
+        self.ignore_filter = IgnoreFilter(root)
+
+    def on_any_event(self, event):
+        # Directory mtime changes always come with an event for the entry itself
+        if event.event_type not in self.CHANGE_EVENTS:
+            return
+        if event.is_directory and event.event_type == 'modified':
+            return
+        for path in (event.src_path, getattr(event, 'dest_path', '')):
+            if not path:
+                continue
+            path = Path(os.fsdecode(path))
+            if path.is_relative_to(self.cache_dir) or not path.is_relative_to(self.root):
+                continue
+            if path.name == '.gitignore' or path.name in IgnoreFilter.IGNORE_FILES:
+                # Changed ignore rules change which files searches see
+                self.ignore_filter.dir_rules.clear()
+            elif self.ignore_filter.excludes(path, event.is_directory):
+                continue
+            self.loop.call_soon_threadsafe(self.warmer.notify_change, str(path))
+
+class CacheWarmer:
+    """Keeps the search cache warm for the queries agents run most often.
+
+    Every search tool call is logged per root. In the background the warmer
+    re-runs the most frequent and recent queries with the largest limit they
+    were asked for: once at startup, shortly after watched files change, and
+    before cached results would expire. Smaller-limit requests are then served
+    from the larger cached result.
+    """
+
+    TOP_QUERIES = 20
+    # A hit counts half as much for every HALF_LIFE seconds since the query was last run
+    HALF_LIFE = 24 * 3600.0
+    MAX_AGE = 30 * 24 * 3600.0
+    INTERVAL = 240.0
+    # Wait for a burst of changes to settle before re-running queries
+    SETTLE_DELAY = 2.0
+    DEADLINE_MS = 10000
+
+    def __init__(self, server: 'LocalSearchMCP'):
+        self.server = server
+        self.changed: set = set()
+        self.event = asyncio.Event()
+
+    def notify_change(self, path: str):
+        self.changed.add(path)
+        self.event.set()
+
+    async def run(self):
+        """Warm the cache at startup, then after every change or INTERVAL."""
+        await self.warm(restart=True)
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.event.wait(), timeout=self.INTERVAL)
+            if self.event.is_set():
+                await asyncio.sleep(self.SETTLE_DELAY)
+            await self.warm()
+
+    async def warm(self, restart: bool = False):
+        """Re-run the top queries whose cached results are stale or about to expire."""
+        self.event.clear()
+        changed, self.changed = list(self.changed), set()
+        indexer = self.server.indexer
+        try:
+            if changed:
+                indexer.invalidate_paths(changed)
+            queries = indexer.frequent_queries(self.TOP_QUERIES, self.HALF_LIFE, self.MAX_AGE)
+            roots = list({root for _, _, root, _ in queries})
+            # Files may have changed while the server was down
+            if restart:
+                indexer.invalidate_paths(roots)
+            else:
+                indexer.expire_soon(roots, self.INTERVAL + self.SETTLE_DELAY)
+        except Exception as e:
+            logger.error(f"Error reading query log: {e}")
+            return
+
+        start = time.time()
+        for tool, params, root, limit in queries:
+            if not Path(root).is_dir():
+                continue
+            # Warming only runs while no other request is
+            while self.server.governor.active:
+                await asyncio.sleep(self.SETTLE_DELAY)
+            try:
+                async with self.server.governor.slot():
+                    # Nobody resumes a warm run, so it leaves no cursor or paused tool behind
+                    await getattr(self.server, tool)(
+                        **params, limit=limit, deadline_ms=self.DEADLINE_MS, register_cursor=False
+                    )
+            except Exception as e:
+                logger.debug(f"Skipped warming {tool} {params}: {e}")
+        if queries:
+            logger.info(f"Warmed {len(queries)} queries in {(time.time() - start) * 1000:.0f}ms")
 
 class LocalSearchMCP:
     """Main MCP server class for local search functionality."""
     
-    def __init__(self, search_root: str = None):
+    # Resume cursors kept for partial searches
+    MAX_CURSORS = 100
+    # Paused native tools kept behind cursors; older cursors resume by restarting the tool
+    MAX_LIVE_STREAMS = 4
+    # Seconds a resume cursor, and the native tool paused behind it, is kept
+    CURSOR_TTL = 120
+    # Upper bound for before/after context lines
+    MAX_CONTEXT_LINES = 20
+    # Backends that report context lines themselves
+    CONTEXT_BACKENDS = {'ripgrep'}
+    # Worker threads used by get_files_info
+    MAX_INFO_WORKERS = 8
+    PREVIEW_LINES = 10
+    # Search tools logged for cache warming, with their default limits
+    WARMABLE_TOOLS = {'search_files': 20, 'search_content': 50, 'search_regex': 50}
+    # Arguments that don't change which results a search finds
+    UNLOGGED_ARGUMENTS = {'limit', 'explain', 'deadline_ms', 'cursor', 'before', 'after'}
+    
+    def __init__(self, search_root: str = None, memory_budget_mb: Optional[int] = None,
+                 max_concurrent: int = 4, watch_root: bool = False):
         self.search_root = Path(search_root) if search_root else Path.cwd()
+        self.watch_root = watch_root
         # Use /tmp for cache directory to avoid permission issues
-        cache_dir = Path('/tmp') / 'local_search_cache'
-        cache_dir.mkdir(exist_ok=True)
-        self.indexer = FileIndexer(str(cache_dir / 'search_cache.db'))
+        self.cache_dir = Path('/tmp') / 'local_search_cache'
+        self.cache_dir.mkdir(exist_ok=True)
+        self.indexer = FileIndexer(str(self.cache_dir / 'search_cache.db'))
+        self.planner = QueryPlanner()
+        self.cursors: OrderedDict = OrderedDict()
+        self.line_cache = LineCache()
+        self.file_info_cache = FileInfoCache(indexer=self.indexer)
+        self.governor = ResourceGovernor(memory_budget_mb, max_concurrent)
+        logger.info(f"Memory budget {self.governor.memory_budget // (1024 * 1024)} MB, "
+                    f"{self.governor.cpu_count} CPUs")
+        self.governor.govern_caches(self.line_cache, self.file_info_cache)
+        self.similarity_indexes: Dict[str, SimilarityIndex] = {}
+        self.governor.govern_similarity_indexes(self.similarity_indexes)
+        self.governor.govern_cursors(self.cursors)
+        self.warmer = CacheWarmer(self)
         self.observer = None
         self.watched_dirs = set()
         
@@ -202,6 +1944,19 @@ class LocalSearchMCP:
                                 "items": {"type": "string"},
                                 "description": "File extensions to include (e.g., ['.py', '.js'])",
                                 "default": []
+                            },
+                            "explain": {
+                                "type": "boolean",
+                                "description": "Include the query plan and backend cost estimates",
+                                "default": False
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; partial results are returned when it runs out"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Resume cursor returned by an earlier partial search"
                             }
                         },
                         "required": ["query"]
@@ -241,6 +1996,29 @@ class LocalSearchMCP:
                                 "type": "integer",
                                 "description": "Maximum number of results",
                                 "default": 50
+                            },
+                            "before": {
+                                "type": "integer",
+                                "description": "Lines of context to show before each match",
+                                "default": 0
+                            },
+                            "after": {
+                                "type": "integer",
+                                "description": "Lines of context to show after each match",
+                                "default": 0
+                            },
+                            "explain": {
+                                "type": "boolean",
+                                "description": "Include the query plan and backend cost estimates",
+                                "default": False
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; partial results are returned when it runs out"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Resume cursor returned by an earlier partial search"
                             }
                         },
                         "required": ["query"]
@@ -270,11 +2048,62 @@ class LocalSearchMCP:
                                 "type": "integer",
                                 "description": "Maximum number of results",
                                 "default": 50
+                            },
+                            "before": {
+                                "type": "integer",
+                                "description": "Lines of context to show before each match",
+                                "default": 0
+                            },
+                            "after": {
+                                "type": "integer",
+                                "description": "Lines of context to show after each match",
+                                "default": 0
+                            },
+                            "explain": {
+                                "type": "boolean",
+                                "description": "Include the query plan and backend cost estimates",
+                                "default": False
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; partial results are returned when it runs out"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Resume cursor returned by an earlier partial search"
                             }
                         },
                         "required": ["pattern"]
                     }
                 ),
+                Tool(
+                    name="search_similar",
+                    description="Find code similar to a natural-language or code query (offline TF-IDF, requires NumPy)",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "query": {
+                                "type": "string",
+                                "description": "Description or snippet of the code to find"
+                            },
+                            "directory": {
+                                "type": "string",
+                                "description": "Directory to search in",
+                                "default": str(self.search_root)
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "Maximum number of results",
+                                "default": 10
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; indexing continues on the next call when it runs out"
+                            }
+                        },
+                        "required": ["query"]
+                    }
+                ),
                 Tool(
                     name="find_files",
                     description="Find files by various criteria (size, date, type, etc.)",
@@ -308,6 +2137,14 @@ class LocalSearchMCP:
                                 "type": "integer",
                                 "description": "Maximum number of results",
                                 "default": 100
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; partial results are returned when it runs out"
+                            },
+                            "cursor": {
+                                "type": "string",
+                                "description": "Resume cursor returned by an earlier partial search"
                             }
                         }
                     }
@@ -326,6 +2163,25 @@ class LocalSearchMCP:
                         "required": ["file_path"]
                     }
                 ),
+                Tool(
+                    name="get_files_info",
+                    description="Get detailed information about many files in one call",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "file_paths": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "Paths of the files to inspect"
+                            },
+                            "deadline_ms": {
+                                "type": "integer",
+                                "description": "Latency budget in milliseconds; files not inspected in time are listed"
+                            }
+                        },
+                        "required": ["file_paths"]
+                    }
+                ),
                 Tool(
                     name="watch_directory",
                     description="Start watching a directory for changes",
@@ -350,57 +2206,87 @@ class LocalSearchMCP:
         @self.server.call_tool()
         async def call_tool(name: str, arguments: Dict[str, Any]) -> List[Union[TextContent, ImageContent, EmbeddedResource]]:
             try:
-                if name == "search_files":
-                    return await self.search_files(**arguments)
-                elif name == "search_content":
-                    return await self.search_content(**arguments)
-                elif name == "search_regex":
-                    return await self.search_regex(**arguments)
-                elif name == "find_files":
-                    return await self.find_files(**arguments)
-                elif name == "get_file_info":
-                    return await self.get_file_info(**arguments)
-                elif name == "watch_directory":
-                    return await self.watch_directory(**arguments)
-                else:
-                    raise ValueError(f"Unknown tool: {name}")
+                if name in self.WARMABLE_TOOLS and not arguments.get("cursor"):
+                    self.log_query(name, arguments)
+                async with self.governor.slot():
+                    if name == "search_files":
+                        return await self.search_files(**arguments)
+                    elif name == "search_content":
+                        return await self.search_content(**arguments)
+                    elif name == "search_regex":
+                        return await self.search_regex(**arguments)
+                    elif name == "find_files":
+                        return await self.find_files(**arguments)
+                    elif name == "get_file_info":
+                        return await self.get_file_info(**arguments)
+                    elif name == "get_files_info":
+                        return await self.get_files_info(**arguments)
+                    elif name == "search_similar":
+                        return await self.search_similar(**arguments)
+                    elif name == "watch_directory":
+                        return await self.watch_directory(**arguments)
+                    else:
+                        raise ValueError(f"Unknown tool: {name}")
             except Exception as e:
                 logger.error(f"Error in tool {name}: {e}")
                 return [TextContent(type="text", text=f"Error: {str(e)}")]
     
+    def log_query(self, name: str, arguments: Dict[str, Any]):
+        """Record a search tool call in the query log for cache warming."""
+        params = {
+            key: value for key, value in arguments.items()
+            if key not in self.UNLOGGED_ARGUMENTS
+        }
+        search_dir = Path(params.get("directory") or self.search_root)
+        params["directory"] = str(search_dir)
+        limit = arguments.get("limit", self.WARMABLE_TOOLS[name])
+        try:
+            self.indexer.log_query(name, params, self.cache_root(search_dir), limit)
+        except Exception as e:
+            logger.debug(f"Error logging query: {e}")
+    
+    def cache_root(self, search_dir: Path) -> str:
+        """Return the root cached results are invalidated by."""
+        return str(search_dir.resolve())
+    
     async def search_files(self, query: str, directory: str = None, 
-                          limit: int = 20, file_types: List[str] = None) -> List[TextContent]:
+                          limit: int = 20, file_types: List[str] = None,
+                          explain: bool = False, deadline_ms: int = None,
+                          cursor: str = None, register_cursor: bool = True) -> List[TextContent]:
         """Search for files by name using fuzzy matching."""
         search_dir = Path(directory) if directory else self.search_root
+        deadline = SearchDeadline(deadline_ms, default_ms=30000)
         
-        # Check cache first
-        cache_key = f"{query}:{search_dir}:{limit}:{file_types}"
-        cached = self.indexer.get_cached_results(cache_key, "file_search")
-        if cached:
-            return [TextContent(type="text", text=self.format_file_results(cached))]
+        # fd matches names by regex and the Python fallback fuzzily, so the
+        # fallback is only used when fd is missing
+        backends = ['fd'] if self.has_command('fd') else ['python']
+        executors = {
+            'fd': functools.partial(self.search_files_with_fd,
+                                    query, search_dir, limit, file_types, deadline),
+            'python': functools.partial(self.search_files_with_python,
+                                        query, search_dir, limit, file_types, deadline),
+        }
         
         try:
-            # Use fd (fast file finder) if available, otherwise use Python
-            if self.has_command('fd'):
-                results = await self.search_files_with_fd(query, search_dir, limit, file_types)
-            else:
-                results = await self.search_files_with_python(query, search_dir, limit, file_types)
-            
-            # Cache results
-            self.indexer.cache_results(cache_key, "file_search", results)
-            
-            return [TextContent(type="text", text=self.format_file_results(results))]
-            
+            return await self.run_search(
+                'file_search', f"{query}:{search_dir}:{file_types}", query, search_dir, limit,
+                backends, executors, self.format_file_results, deadline, cursor, explain,
+                register_cursor=register_cursor
+            )
         except Exception as e:
             logger.error(f"Error searching files: {e}")
             return [TextContent(type="text", text=f"Error searching files: {str(e)}")]
     
     async def search_files_with_fd(self, query: str, directory: Path, 
-                                  limit: int, file_types: List[str]) -> List[SearchResult]:
+                                  limit: int, file_types: List[str],
+                                  deadline: SearchDeadline,
+                                  progress: SearchProgress) -> List[SearchResult]:
         """Use fd command for fast file searching."""
         # Use fdfind if fd is not available
         fd_cmd = 'fdfind' if not self.has_command('fd') else 'fd'
-        cmd = [fd_cmd, '--max-results', str(limit)]
+        # fd is stopped once limit results are read, and a partial search
+        # keeps reading from the same process when resumed
+        cmd = [fd_cmd]
         
         if file_types:
             for ext in file_types:
@@ -408,27 +2294,45 @@ class LocalSearchMCP:
         
         cmd.extend([query, str(directory)])
         
+        results = []
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            if result.returncode == 0:
-                files = result.stdout.strip().split('\n')
-                return [SearchResult(file_path=f, score=100.0) for f in files if f]
-            else:
-                return []
-        except subprocess.TimeoutExpired:
-            logger.warning("fd search timed out")
-            return []
+            async with contextlib.aclosing(self.stream_command(cmd, deadline, progress)) as lines:
+                async for line in lines:
+                    if not line or progress.skip_match(line):
+                        continue
+                    results.append(SearchResult(file_path=line, score=100.0))
+                    progress.finish_file(line)
+                    if len(results) >= limit:
+                        break
         except Exception as e:
             logger.error(f"fd search error: {e}")
-            return []
+        
+        return results
     
     async def search_files_with_python(self, query: str, directory: Path, 
-                                      limit: int, file_types: List[str]) -> List[SearchResult]:
+                                      limit: int, file_types: List[str],
+                                      deadline: SearchDeadline,
+                                      progress: SearchProgress) -> List[SearchResult]:
         """Fallback Python-based file search with fuzzy matching."""
+        # The walk runs in a worker thread so it doesn't block other requests
+        return await asyncio.to_thread(
+            self.fuzzy_search_files, query, directory, limit, file_types, deadline, progress
+        )
+    
+    def fuzzy_search_files(self, query: str, directory: Path, limit: int,
+                           file_types: List[str], deadline: SearchDeadline,
+                           progress: SearchProgress) -> List[SearchResult]:
         results = []
         
         try:
-            for file_path in directory.rglob('*'):
+            for index, file_path in enumerate(directory.rglob('*')):
+                if index < progress.position:
+                    continue
+                if deadline.expired():
+                    progress.partial = True
+                    break
+                progress.position = index + 1
+                
                 if file_path.is_file():
                     # Check file type filter
                     if file_types and file_path.suffix not in file_types:
@@ -452,41 +2356,47 @@ class LocalSearchMCP:
     
     async def search_content(self, query: str, directory: str = None, 
                            case_sensitive: bool = False, whole_word: bool = False,
-                           file_pattern: str = "**/*", limit: int = 50) -> List[TextContent]:
+                           file_pattern: str = "**/*", limit: int = 50,
+                           before: int = 0, after: int = 0,
+                           explain: bool = False, deadline_ms: int = None,
+                           cursor: str = None, register_cursor: bool = True) -> List[TextContent]:
         """Search for text content within files using ripgrep."""
         search_dir = Path(directory) if directory else self.search_root
+        deadline = SearchDeadline(deadline_ms, default_ms=60000)
+        before, after = self.clamp_context(before, after)
         
-        # Check cache first
-        cache_key = f"{query}:{search_dir}:{case_sensitive}:{whole_word}:{file_pattern}:{limit}"
-        cached = self.indexer.get_cached_results(cache_key, "content_search")
-        if cached:
-            return [TextContent(type="text", text=self.format_content_results(cached))]
+        # Let the planner pick between ripgrep and the Python fallback
+        backends = ['ripgrep', 'python'] if self.has_command('rg') else ['python']
+        executors = {
+            'ripgrep': functools.partial(
+                self.search_content_with_ripgrep, query, search_dir, case_sensitive, whole_word,
+                file_pattern, limit, deadline, before=before, after=after
+            ),
+            'python': functools.partial(
+                self.search_content_with_python, query, search_dir, case_sensitive, whole_word,
+                file_pattern, limit, deadline, keep_lines=bool(before or after)
+            ),
+        }
         
         try:
-            # Use ripgrep if available, otherwise use Python
-            if self.has_command('rg'):
-                results = await self.search_content_with_ripgrep(
-                    query, search_dir, case_sensitive, whole_word, file_pattern, limit
-                )
-            else:
-                results = await self.search_content_with_python(
-                    query, search_dir, case_sensitive, whole_word, file_pattern, limit
-                )
-            
-            # Cache results
-            self.indexer.cache_results(cache_key, "content_search", results)
-            
-            return [TextContent(type="text", text=self.format_content_results(results))]
-            
+            return await self.run_search(
+                'content_search', f"{query}:{search_dir}:{case_sensitive}:{whole_word}:{file_pattern}",
+                query, search_dir, limit, backends, executors, self.format_content_results,
+                deadline, cursor, explain, before=before, after=after,
+                register_cursor=register_cursor
+            )
         except Exception as e:
             logger.error(f"Error searching content: {e}")
             return [TextContent(type="text", text=f"Error searching content: {str(e)}")]
     
     async def search_content_with_ripgrep(self, query: str, directory: Path,
                                          case_sensitive: bool, whole_word: bool,
-                                         file_pattern: str, limit: int) -> List[SearchResult]:
+                                         file_pattern: str, limit: int,
+                                         deadline: SearchDeadline, progress: SearchProgress,
+                                         before: int = 0, after: int = 0) -> List[SearchResult]:
         """Use ripgrep for fast content searching."""
-        cmd = ['rg', '--json', '--max-count', str(limit)]
+        # Queries are plain text, as in the Python fallback
+        cmd = ['rg', '--json', '--fixed-strings', '--max-count', str(limit)]
         
         if not case_sensitive:
             cmd.append('--ignore-case')
@@ -497,118 +2407,347 @@ class LocalSearchMCP:
         if file_pattern != "**/*":
             cmd.extend(['--glob', file_pattern])
         
-        cmd.extend([query, str(directory)])
+        cmd.extend(['--', query])
         
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-            if result.returncode == 0:
-                results = []
-                for line in result.stdout.strip().split('\n'):
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if data.get('type') == 'match':
-                                match = data['data']
-                                results.append(SearchResult(
-                                    file_path=match['path']['text'],
-                                    line_number=match['line_number'],
-                                    column=match['submatches'][0]['start'] + 1,
-                                    content=match['lines']['text'].strip()
-                                ))
-                        except json.JSONDecodeError:
-                            continue
-                return results
-            else:
-                return []
-        except subprocess.TimeoutExpired:
-            logger.warning("ripgrep search timed out")
-            return []
-        except Exception as e:
-            logger.error(f"ripgrep search error: {e}")
-            return []
+        return await self.run_ripgrep(cmd, directory, limit, deadline, progress, before, after)
     
     async def search_content_with_python(self, query: str, directory: Path,
                                         case_sensitive: bool, whole_word: bool,
-                                        file_pattern: str, limit: int) -> List[SearchResult]:
+                                        file_pattern: str, limit: int,
+                                        deadline: SearchDeadline, progress: SearchProgress,
+                                        keep_lines: bool = False) -> List[SearchResult]:
         """Fallback Python-based content search."""
-        results = []
         search_query = query if case_sensitive else query.lower()
+        # Same word boundaries as ripgrep's --word-regexp
+        word_regex = re.compile(
+            r'(?<!\w)' + re.escape(query) + r'(?!\w)', 0 if case_sensitive else re.IGNORECASE
+        )
+        
+        def match_line(line: str) -> int:
+            if whole_word:
+                match = word_regex.search(line)
+                return match.start() + 1 if match else 0
+            search_line = line if case_sensitive else line.lower()
+            return search_line.find(search_query) + 1
+        
+        return await self.scan_files_with_python(
+            directory, file_pattern, match_line, limit, deadline, progress, keep_lines
+        )
+    
+    async def search_regex(self, pattern: str, directory: str = None,
+                          file_pattern: str = "**/*", limit: int = 50,
+                          before: int = 0, after: int = 0,
+                          explain: bool = False, deadline_ms: int = None,
+                          cursor: str = None, register_cursor: bool = True) -> List[TextContent]:
+        """Search using regular expressions."""
+        search_dir = Path(directory) if directory else self.search_root
+        deadline = SearchDeadline(deadline_ms, default_ms=60000)
+        before, after = self.clamp_context(before, after)
+        
+        # Python's re and ripgrep's regex engine accept different syntax, so
+        # the fallback is only used when rg is missing
+        backends = ['ripgrep'] if self.has_command('rg') else ['python']
+        executors = {
+            'ripgrep': functools.partial(
+                self.search_regex_with_ripgrep, pattern, search_dir, file_pattern, limit, deadline,
+                before=before, after=after
+            ),
+            'python': functools.partial(
+                self.search_regex_with_python, pattern, search_dir, file_pattern, limit, deadline,
+                keep_lines=bool(before or after)
+            ),
+        }
+        
+        try:
+            return await self.run_search(
+                'regex_search', f"{pattern}:{search_dir}:{file_pattern}", pattern, search_dir, limit,
+                backends, executors, self.format_content_results, deadline, cursor, explain,
+                before=before, after=after, is_regex=True, register_cursor=register_cursor
+            )
+        except Exception as e:
+            logger.error(f"Error in regex search: {e}")
+            return [TextContent(type="text", text=f"Error in regex search: {str(e)}")]
+    
+    async def run_search(self, search_type: str, cache_key: str, query: str, search_dir: Path,
+                         limit: int, backends: List[str], executors: Dict[str, Callable],
+                         format_results: Callable[[List[SearchResult]], str],
+                         deadline: SearchDeadline, cursor: Optional[str], explain: bool,
+                         before: int = 0, after: int = 0, is_regex: bool = False,
+                         register_cursor: bool = True) -> List[TextContent]:
+        """Answer a search from the cache, or plan it, run it and cache the results.
+        
+        executors maps each backend to a coroutine function that takes the
+        search progress and returns the results. Results cached for a larger
+        limit also answer a smaller one, and a resumed search keeps the
+        backend it started with. Without register_cursor a partial search
+        is dropped instead of being saved for resuming.
+        """
+        query_key = f"{search_type}:{cache_key}"
+        if not cursor:
+            cached = self.indexer.get_cached_results(cache_key, search_type, limit)
+            if cached:
+                if before or after:
+                    await asyncio.to_thread(self.attach_context, cached, before, after)
+                text = format_results(cached)
+                if explain:
+                    text += f"\n🧭 Query plan ({search_type}): served from cache\n"
+                return [TextContent(type="text", text=text)]
+        
+        progress = self.resume_progress(cursor, query_key)
+        if progress:
+            backends = [progress.backend]
+        plan = self.planner.plan(search_type, search_dir, query, backends, limit, is_regex=is_regex)
+        progress = progress or SearchProgress(query_key, plan.backend)
+        
+        start = time.time()
+        results = await executors[plan.backend](progress)
+        
+        # Partial and resumed results describe only part of the tree
+        if not progress.partial and not cursor:
+            self.planner.record(plan, (time.time() - start) * 1000)
+            self.indexer.cache_results(cache_key, search_type, results,
+                                       root=self.cache_root(search_dir), result_limit=limit)
+        
+        if (before or after) and plan.backend not in self.CONTEXT_BACKENDS:
+            await asyncio.to_thread(self.attach_context, results, before, after)
+        text = format_results(results)
+        if register_cursor:
+            text += self.format_partial_notice(progress, deadline)
+        else:
+            progress.discard()
+        if explain:
+            text += "\n" + plan.explain()
+        return [TextContent(type="text", text=text)]
+    
+    async def search_regex_with_ripgrep(self, pattern: str, directory: Path,
+                                       file_pattern: str, limit: int,
+                                       deadline: SearchDeadline, progress: SearchProgress,
+                                       before: int = 0, after: int = 0) -> List[SearchResult]:
+        """Use ripgrep for fast regular expression searching."""
+        cmd = ['rg', '--json', '--max-count', str(limit)]
+        if file_pattern != "**/*":
+            cmd.extend(['--glob', file_pattern])
+        cmd.extend(['--', pattern])
+        return await self.run_ripgrep(cmd, directory, limit, deadline, progress, before, after)
+    
+    async def search_regex_with_python(self, pattern: str, directory: Path,
+                                      file_pattern: str, limit: int,
+                                      deadline: SearchDeadline, progress: SearchProgress,
+                                      keep_lines: bool = False) -> List[SearchResult]:
+        """Fallback Python-based regular expression search."""
+        regex = re.compile(pattern)
         
+        def match_line(line: str) -> int:
+            match = regex.search(line)
+            return match.start() + 1 if match else 0
+        
+        return await self.scan_files_with_python(
+            directory, file_pattern, match_line, limit, deadline, progress, keep_lines
+        )
+    
+    async def run_ripgrep(self, cmd: List[str], directory: Path, limit: int,
+                          deadline: SearchDeadline, progress: SearchProgress,
+                          before: int = 0, after: int = 0) -> List[SearchResult]:
+        """Run a ripgrep --json command in a directory and collect matches until the limit or deadline.
+        
+        ripgrep matches globs containing a slash against paths relative to its
+        working directory, so it runs inside the search directory. With before
+        or after set, context lines come from ripgrep's own context messages.
+        """
+        results = []
+        if before or after:
+            cmd = cmd[:2] + ['--before-context', str(before), '--after-context', str(after)] + cmd[2:]
+        cmd = cmd + ['.']
+        # Recent lines of the current file, and matches still collecting after-context
+        recent: List[Tuple[int, str]] = []
+        waiting: List[SearchResult] = []
         try:
-            for file_path in directory.rglob(file_pattern):
-                if file_path.is_file() and file_path.is_relative_to(directory):
+            async with contextlib.aclosing(self.stream_command(cmd, deadline, progress, cwd=directory)) as lines:
+                async for line in lines:
+                    if not line:
+                        continue
                     try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            for line_num, line in enumerate(f, 1):
-                                search_line = line if case_sensitive else line.lower()
-                                
-                                if whole_word:
-                                    if search_query in search_line.split():
-                                        results.append(SearchResult(
-                                            file_path=str(file_path),
-                                            line_number=line_num,
-                                            content=line.strip()
-                                        ))
-                                else:
-                                    if search_query in search_line:
-                                        results.append(SearchResult(
-                                            file_path=str(file_path),
-                                            line_number=line_num,
-                                            content=line.strip()
-                                        ))
-                                
-                                if len(results) >= limit:
-                                    return results
-                    except (UnicodeDecodeError, PermissionError):
+                        data = json.loads(line)
+                        kind = data.get('type')
+                        if kind in ('begin', 'end'):
+                            recent, waiting = [], []
+                            if kind == 'end':
+                                progress.finish_file(str(directory / data['data']['path']['text']))
+                            if len(results) >= limit:
+                                break
+                            continue
+                        if kind not in ('match', 'context'):
+                            continue
+                        
+                        match = data['data']
+                        line_number = match['line_number']
+                        text = match['lines'].get('text', '').rstrip('\r\n')
+                        for result in waiting:
+                            result.context_after.append(text)
+                        waiting = [result for result in waiting
+                                   if line_number - result.line_number < after]
+                        
+                        if kind == 'match' and len(results) < limit:
+                            file_path = str(directory / match['path']['text'])
+                            if not progress.skip_match(file_path, line_number):
+                                result = SearchResult(
+                                    file_path=file_path,
+                                    line_number=line_number,
+                                    column=match['submatches'][0]['start'] + 1 if match['submatches'] else 0,
+                                    content=text if before or after else text.strip()
+                                )
+                                result.context_before = [
+                                    context for number, context in recent if number >= line_number - before
+                                ]
+                                results.append(result)
+                                progress.note_match(file_path, line_number)
+                                if after:
+                                    waiting.append(result)
+                        
+                        if before:
+                            recent.append((line_number, text))
+                            del recent[:-before]
+                        if len(results) >= limit and not waiting:
+                            break
+                    except (json.JSONDecodeError, KeyError):
                         continue
+        except Exception as e:
+            logger.error(f"ripgrep search error: {e}")
+        
+        return results
+    
+    async def scan_files_with_python(self, directory: Path, file_pattern: str,
+                                     match_line, limit: int, deadline: SearchDeadline,
+                                     progress: SearchProgress, keep_lines: bool = False) -> List[SearchResult]:
+        """Scan files line by line, collecting lines where match_line returns a column.
+        
+        Files are selected like ripgrep selects them: hidden, ignored and
+        binary files are skipped. The scan runs in a worker thread so it
+        doesn't block other requests. With keep_lines set, scanned files go
+        through the line cache so context lines can be served from it.
+        """
+        return await asyncio.to_thread(
+            self.scan_files, directory, file_pattern, match_line, limit, deadline, progress,
+            keep_lines
+        )
+    
+    def scan_files(self, directory: Path, file_pattern: str, match_line, limit: int,
+                   deadline: SearchDeadline, progress: SearchProgress,
+                   keep_lines: bool) -> List[SearchResult]:
+        results = []
+        ignore_filter = IgnoreFilter(directory, None if file_pattern == "**/*" else file_pattern)
+        
+        try:
+            for index, file_path in enumerate(ignore_filter.walk()):
+                if index < progress.position:
+                    continue
+                if deadline.expired():
+                    progress.partial = True
+                    return results
+                
+                resume_line = progress.last_lines.get(str(file_path), 0)
+                try:
+                    for line_num, line in enumerate(self.read_text_lines(file_path, keep_lines), 1):
+                        if line_num <= resume_line:
+                            continue
+                        
+                        column = match_line(line)
+                        if column:
+                            results.append(SearchResult(
+                                file_path=str(file_path),
+                                line_number=line_num,
+                                column=column,
+                                content=line.strip()
+                            ))
+                            if len(results) >= limit:
+                                # Resume after this line in the same file
+                                progress.note_match(str(file_path), line_num)
+                                return results
+                        elif line_num % 1000 == 0 and deadline.expired():
+                            progress.note_match(str(file_path), line_num)
+                            progress.partial = True
+                            return results
+                except (UnicodeDecodeError, OSError):
+                    pass
+                progress.last_lines.pop(str(file_path), None)
+                
+                progress.position = index + 1
         except Exception as e:
             logger.error(f"Python content search error: {e}")
         
         return results[:limit]
     
-    async def search_regex(self, pattern: str, directory: str = None,
-                          file_pattern: str = "**/*", limit: int = 50) -> List[TextContent]:
-        """Search using regular expressions."""
+    def read_text_lines(self, file_path: Path, keep_lines: bool):
+        """Yield the lines of a text file; binary files yield nothing, as in ripgrep."""
+        with open(file_path, 'rb') as f:
+            if b'\0' in f.read(IgnoreFilter.BINARY_SAMPLE):
+                return
+            if keep_lines:
+                yield from self.line_cache.iter_lines(str(file_path))
+                return
+            f.seek(0)
+            for line in io.TextIOWrapper(f, encoding='utf-8', errors='ignore'):
+                if '\0' in line:
+                    return
+                yield line
+    
+    async def search_similar(self, query: str, directory: str = None, limit: int = 10,
+                             deadline_ms: int = None) -> List[TextContent]:
+        """Find the chunks of code most similar to a query."""
+        if np is None:
+            return [TextContent(type="text", text="Similarity search requires NumPy to be installed")]
+        
         search_dir = Path(directory) if directory else self.search_root
+        deadline = SearchDeadline(deadline_ms, default_ms=60000)
         
         try:
-            if self.has_command('rg'):
-                cmd = ['rg', '--json', '--max-count', str(limit), '--glob', file_pattern, pattern, str(search_dir)]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                
-                if result.returncode == 0:
-                    results = []
-                    for line in result.stdout.strip().split('\n'):
-                        if line:
-                            try:
-                                data = json.loads(line)
-                                if data.get('type') == 'match':
-                                    match = data['data']
-                                    results.append(SearchResult(
-                                        file_path=match['path']['text'],
-                                        line_number=match['line_number'],
-                                        content=match['lines']['text'].strip()
-                                    ))
-                            except json.JSONDecodeError:
-                                continue
-                    
-                    return [TextContent(type="text", text=self.format_content_results(results))]
-            else:
-                return [TextContent(type="text", text="Regular expression search requires ripgrep (rg) to be installed")]
-                
+            index = self.similarity_index(search_dir)
+            workers = self.governor.worker_limit(SimilarityIndex.MAX_WORKERS)
+            batch_bytes = self.governor.batch_bytes(SimilarityIndex.BATCH_BYTES)
+            pending = await asyncio.to_thread(index.refresh, deadline, workers, batch_bytes)
+            # Formatting reads each hit's lines from disk, so it stays off the event loop
+            text = await asyncio.to_thread(self.query_similar, index, query, limit)
+            if index.walk is not None:
+                text += (f"\n⏱ Partial results: the {deadline.budget_ms} ms deadline was reached "
+                         f"while listing files to index.\nRepeat the query to continue indexing.\n")
+            elif pending:
+                text += (f"\n⏱ Partial results: the {deadline.budget_ms} ms deadline was reached "
+                         f"with {pending:,} files left to index.\nRepeat the query to continue indexing.\n")
+            return [TextContent(type="text", text=text)]
+            
         except Exception as e:
-            logger.error(f"Error in regex search: {e}")
-            return [TextContent(type="text", text=f"Error in regex search: {str(e)}")]
+            logger.error(f"Error in similarity search: {e}")
+            return [TextContent(type="text", text=f"Error in similarity search: {str(e)}")]
+    
+    def similarity_index(self, directory: Path) -> SimilarityIndex:
+        """Get the similarity index for a directory, loading it from disk if needed."""
+        key = str(directory.resolve())
+        if key not in self.similarity_indexes:
+            storage_dir = self.cache_dir / 'similarity' / hashlib.sha1(key.encode()).hexdigest()[:16]
+            self.similarity_indexes[key] = SimilarityIndex(Path(key), storage_dir)
+        return self.similarity_indexes[key]
     
     async def find_files(self, directory: str = None, name_pattern: str = "*",
                         min_size: int = None, max_size: int = None,
-                        file_types: List[str] = None, limit: int = 100) -> List[TextContent]:
+                        file_types: List[str] = None, limit: int = 100,
+                        deadline_ms: int = None, cursor: str = None) -> List[TextContent]:
         """Find files by various criteria."""
         search_dir = Path(directory) if directory else self.search_root
+        deadline = SearchDeadline(deadline_ms, default_ms=30000)
+        query_key = f"find_files:{search_dir}:{name_pattern}:{min_size}:{max_size}:{file_types}"
         results = []
         
         try:
-            for file_path in search_dir.rglob(name_pattern):
+            progress = self.resume_progress(cursor, query_key) or SearchProgress(query_key, 'python')
+            
+            for index, file_path in enumerate(search_dir.rglob(name_pattern)):
+                if index < progress.position:
+                    continue
+                if deadline.expired():
+                    progress.partial = True
+                    break
+                progress.position = index + 1
+                
                 if file_path.is_file():
                     # Check file type filter
                     if file_types and file_path.suffix not in file_types:
@@ -629,7 +2768,9 @@ class LocalSearchMCP:
                     if len(results) >= limit:
                         break
             
-            return [TextContent(type="text", text=self.format_file_results(results))]
+            text = self.format_file_results(results)
+            text += self.format_partial_notice(progress, deadline)
+            return [TextContent(type="text", text=text)]
             
         except Exception as e:
             logger.error(f"Error finding files: {e}")
@@ -638,26 +2779,71 @@ class LocalSearchMCP:
     async def get_file_info(self, file_path: str) -> List[TextContent]:
         """Get detailed information about a specific file."""
         try:
-            path = Path(file_path)
-            if not path.exists():
-                return [TextContent(type="text", text=f"File not found: {file_path}")]
+            info = await asyncio.to_thread(self.describe_file, file_path)
+            return [TextContent(type="text", text=info)]
             
-            stat = path.stat()
+        except Exception as e:
+            logger.error(f"Error getting file info: {e}")
+            return [TextContent(type="text", text=f"Error getting file info: {str(e)}")]
+    
+    async def get_files_info(self, file_paths: List[str],
+                             deadline_ms: int = None) -> List[TextContent]:
+        """Get detailed information about many files in one call."""
+        deadline = SearchDeadline(deadline_ms, default_ms=30000)
+        semaphore = asyncio.Semaphore(self.governor.worker_limit(self.MAX_INFO_WORKERS))
+        
+        async def describe(file_path: str) -> str:
+            async with semaphore:
+                return await asyncio.to_thread(self.describe_file, file_path)
+        
+        try:
+            tasks = [asyncio.ensure_future(describe(file_path)) for file_path in file_paths]
+            if not tasks:
+                return [TextContent(type="text", text="No files requested.")]
+            done, pending = await asyncio.wait(tasks, timeout=deadline.remaining())
+            for task in pending:
+                task.cancel()
             
-            # Get file type
-            if magic:
-                try:
-                    file_type = magic.from_file(str(path), mime=True)
-                except:
-                    file_type = "unknown"
-            else:
-                # Fallback to basic file type detection
-                if path.suffix:
-                    file_type = f"application/{path.suffix[1:]}"
+            sections = []
+            for file_path, task in zip(file_paths, tasks):
+                if task not in done:
+                    continue
+                if task.exception():
+                    sections.append(f"Error getting file info for {file_path}: {task.exception()}")
                 else:
-                    file_type = "unknown"
+                    sections.append(task.result())
+            
+            text = f"📚 File information for {len(sections)} of {len(file_paths)} files:\n\n"
+            text += "\n\n".join(sections)
+            if pending:
+                skipped = [file_path for file_path, task in zip(file_paths, tasks) if task in pending]
+                text += f"\n\n⏱ Partial results: the {deadline.budget_ms} ms deadline was reached.\n"
+                text += "Not inspected:\n" + "\n".join(f"  {file_path}" for file_path in skipped) + "\n"
+            return [TextContent(type="text", text=text)]
             
-            info = f"""📄 File Information: {file_path}
+        except Exception as e:
+            logger.error(f"Error getting files info: {e}")
+            return [TextContent(type="text", text=f"Error getting files info: {str(e)}")]
+    
+    def describe_file(self, file_path: str) -> str:
+        """Build the information report for a file, reusing cached type and preview."""
+        path = Path(file_path)
+        if not path.exists():
+            return f"File not found: {file_path}"
+        
+        stat = path.stat()
+        
+        # File type and preview only change when the file does
+        key = FileInfoCache.key(stat)
+        cached = self.file_info_cache.get(key)
+        if cached:
+            file_type, preview = cached
+        else:
+            file_type = self.detect_file_type(path)
+            preview = self.read_preview(path, file_type)
+            self.file_info_cache.put(key, file_type, preview)
+        
+        info = f"""📄 File Information: {file_path}
 
 📊 Basic Info:
   Size: {stat.st_size:,} bytes
@@ -673,24 +2859,42 @@ class LocalSearchMCP:
   Stem: {path.stem}
 
 🔍 Content Preview:"""
-            
-            # Add content preview for text files
-            if file_type.startswith('text/') or path.suffix in ['.py', '.js', '.ts', '.md', '.txt', '.json', '.yaml', '.yml']:
-                try:
-                    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                        lines = f.readlines()[:10]
-                        for i, line in enumerate(lines, 1):
-                            info += f"\n  {i:3d}: {line.rstrip()}"
-                        if len(lines) == 10:
-                            info += "\n  ... (truncated)"
-                except:
-                    info += "\n  (Could not read file content)"
-            
-            return [TextContent(type="text", text=info)]
-            
-        except Exception as e:
-            logger.error(f"Error getting file info: {e}")
-            return [TextContent(type="text", text=f"Error getting file info: {str(e)}")]
+        
+        if preview is None:
+            info += "\n  (Could not read file content)"
+        else:
+            for i, line in enumerate(preview[:self.PREVIEW_LINES], 1):
+                info += f"\n  {i:3d}: {line}"
+            if len(preview) > self.PREVIEW_LINES:
+                info += "\n  ... (truncated)"
+        
+        return info
+    
+    def detect_file_type(self, path: Path) -> str:
+        """Detect a file's MIME type with libmagic, falling back to its extension."""
+        if magic:
+            try:
+                return magic.from_file(str(path), mime=True)
+            except Exception:
+                return "unknown"
+        # Fallback to basic file type detection
+        if path.suffix:
+            return f"application/{path.suffix[1:]}"
+        return "unknown"
+    
+    def read_preview(self, path: Path, file_type: str) -> Optional[List[str]]:
+        """Read the first lines of a text file.
+        
+        Returns one line more than PREVIEW_LINES so truncation can be detected,
+        an empty list for non-text files and None if the file can't be read.
+        """
+        if not (file_type.startswith('text/') or path.suffix in ['.py', '.js', '.ts', '.md', '.txt', '.json', '.yaml', '.yml']):
+            return []
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                return [line.rstrip() for line in itertools.islice(f, self.PREVIEW_LINES + 1)]
+        except Exception:
+            return None
     
     async def watch_directory(self, directory: str, recursive: bool = True) -> List[TextContent]:
         """Start watching a directory for changes."""
@@ -702,8 +2906,16 @@ class LocalSearchMCP:
             if str(watch_path) in self.watched_dirs:
                 return [TextContent(type="text", text=f"Already watching: {directory}")]
             
-            # Start watching (simplified implementation)
+            # Changes invalidate cached results under the directory and re-warm them
+            if self.observer is None:
+                self.observer = Observer()
+                self.observer.daemon = True
+                self.observer.start()
+            root = watch_path.resolve()
+            handler = ChangeHandler(self.warmer, asyncio.get_running_loop(), root, self.cache_dir.resolve())
             self.watched_dirs.add(str(watch_path))
+            # Setting up inotify watches walks the whole tree
+            await asyncio.to_thread(self.observer.schedule, handler, str(root), recursive=recursive)
             
             return [TextContent(type="text", text=f"Started watching directory: {directory}\nRecursive: {recursive}")]
             
@@ -713,19 +2925,71 @@ class LocalSearchMCP:
     
     def has_command(self, command: str) -> bool:
         """Check if a command is available in the system PATH."""
-        try:
-            subprocess.run(['which', command], capture_output=True, check=True)
+        if shutil.which(command):
             return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            # Check for alternative command names
-            if command == 'fd':
-                try:
-                    subprocess.run(['which', 'fdfind'], capture_output=True, check=True)
-                    return True
-                except (subprocess.CalledProcessError, FileNotFoundError):
-                    pass
-            return False
+        # Check for alternative command names
+        return command == 'fd' and shutil.which('fdfind') is not None
     
+    async def stream_command(self, cmd: List[str], deadline: SearchDeadline,
+                             progress: SearchProgress, cwd: Path = None):
+        """Yield stdout lines from a command until it exits or the deadline passes.
+        
+        At the deadline the command is left running in progress.stream, and a
+        resumed search continues reading its output instead of starting over.
+        """
+        stream = progress.stream or await CommandStream.start(cmd, cwd)
+        progress.stream = None
+        try:
+            while True:
+                try:
+                    line = await stream.readline(deadline.remaining())
+                except asyncio.TimeoutError:
+                    logger.warning(f"{cmd[0]} search reached its {deadline.budget_ms} ms deadline")
+                    progress.partial = True
+                    progress.stream = stream
+                    return
+                if line is None:
+                    return
+                yield line
+        finally:
+            if progress.stream is not stream:
+                await stream.close()
+
+    def resume_progress(self, cursor: Optional[str], query_key: str) -> Optional[SearchProgress]:
+        """Look up the progress saved for a resume cursor."""
+        if not cursor:
+            return None
+
+        progress = self.cursors.pop(cursor, None)
+        if progress is None or progress.query_key != query_key:
+            if progress is not None:
+                progress.discard()
+            raise ValueError(f"Unknown or expired cursor: {cursor}")
+        progress.partial = False
+        return progress
+
+    def expire_cursor(self, token: str):
+        progress = self.cursors.pop(token, None)
+        if progress is not None:
+            progress.discard()
+
+    def format_partial_notice(self, progress: SearchProgress, deadline: SearchDeadline) -> str:
+        """Describe a partial search and save its progress under a new resume cursor."""
+        if not progress.partial:
+            return ""
+
+        token = secrets.token_hex(8)
+        self.cursors[token] = progress
+        while len(self.cursors) > self.MAX_CURSORS:
+            self.cursors.popitem(last=False)[1].discard()
+        live = [saved for saved in self.cursors.values() if saved.stream is not None]
+        for saved in live[:-self.MAX_LIVE_STREAMS]:
+            saved.discard()
+        asyncio.get_running_loop().call_later(self.CURSOR_TTL, self.expire_cursor, token)
+
+        return (f"\n⏱ Partial results: the {deadline.budget_ms} ms deadline was reached.\n"
+                f"Resume with cursor: {token}\n")
+
     def format_file_results(self, results: List[SearchResult]) -> str:
         """Format file search results for display."""
         if not results:
@@ -764,29 +3028,113 @@ class LocalSearchMCP:
                 output += f":{result.column}"
             output += "\n"
             
-            if result.content:
-                # Truncate long lines
-                content = result.content
-                if len(content) > 100:
-                    content = content[:97] + "..."
-                output += f"    {content}\n"
+            if result.context_before or result.context_after:
+                first_line = result.line_number - len(result.context_before)
+                lines = result.context_before + [result.content] + result.context_after
+                for line_number, line in enumerate(lines, first_line):
+                    marker = ">" if line_number == result.line_number else " "
+                    output += f"  {marker} {line_number:5d}  {self.truncate_line(line)}\n"
+            elif result.content:
+                output += f"    {self.truncate_line(result.content)}\n"
+            output += "\n"
+        
+        return output
+    
+    def query_similar(self, index: SimilarityIndex, query: str, limit: int) -> str:
+        """Query a similarity index and format the hits."""
+        return self.format_similar_results(index.query(query, limit), query)
+    
+    def format_similar_results(self, matches: List[Tuple[float, str, int, int]], query: str) -> str:
+        """Format similarity search results, showing the chunk line closest to the query."""
+        if not matches:
+            return "No similar code found."
+        
+        query_tokens = set(SimilarityIndex.tokenize(query))
+        output = f"Found {len(matches)} similar chunks:\n\n"
+        for i, (score, chunk_path, start, end) in enumerate(matches, 1):
+            file_path = Path(chunk_path)
+            relative_path = file_path.relative_to(self.search_root) if file_path.is_relative_to(self.search_root) else file_path
+            output += f"{i:2d}. 📄 {relative_path}:{start}-{end}\n"
+            output += f"    Similarity: {score * 100:.1f}%\n"
+            
+            entry = self.line_cache.load(chunk_path)
+            if entry is not None:
+                best = max(
+                    enumerate(entry.lines(start, end), start),
+                    key=lambda item: len(query_tokens.intersection(SimilarityIndex.tokenize(item[1]))),
+                    default=None
+                )
+                if best is not None and best[1].strip():
+                    output += f"    {best[0]}: {self.truncate_line(best[1].strip())}\n"
             output += "\n"
         
         return output
     
+    def truncate_line(self, line: str) -> str:
+        """Truncate long lines for display."""
+        if len(line) > 100:
+            return line[:97] + "..."
+        return line
+    
+    def clamp_context(self, before: int, after: int) -> Tuple[int, int]:
+        """Limit the requested context lines to 0..MAX_CONTEXT_LINES."""
+        return (min(max(before, 0), self.MAX_CONTEXT_LINES),
+                min(max(after, 0), self.MAX_CONTEXT_LINES))
+    
+    def attach_context(self, results: List[SearchResult], before: int, after: int):
+        """Fill in the lines around each match from the hot line cache.
+        
+        This reads files that aren't cached yet, so it runs in a worker thread.
+        """
+        before, after = self.clamp_context(before, after)
+        if not before and not after:
+            return
+        
+        for result in results:
+            if result.line_number > 0:
+                context_before, line, context_after = self.line_cache.context(
+                    result.file_path, result.line_number, before, after
+                )
+                if line is not None:
+                    # Keep the indentation so the match lines up with its context
+                    result.content = line
+                    result.context_before = context_before
+                    result.context_after = context_after
+    
     async def run(self):
         """Run the MCP server."""
-        async with stdio_server() as (read_stream, write_stream):
-            await self.server.run(
-                read_stream,
-                write_stream,
-                self.server.create_initialization_options()
-            )
+        tasks = [asyncio.create_task(self.warmer.run())]
+        if self.watch_root:
+            tasks.append(asyncio.create_task(self.watch_directory(str(self.search_root))))
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                await self.server.run(
+                    read_stream,
+                    write_stream,
+                    self.server.create_initialization_options()
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.observer is not None:
+                self.observer.stop()
+                self.observer.join(timeout=5)
 
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(description="Local Search MCP Server")
     parser.add_argument("--search-root", type=str, help="Root directory to search")
+    parser.add_argument("--memory-budget-mb", type=int,
+                        default=int(os.environ["LOCAL_SEARCH_MEMORY_MB"]) if os.environ.get("LOCAL_SEARCH_MEMORY_MB") else None,
+                        help="Memory budget in MB (env: LOCAL_SEARCH_MEMORY_MB; default: 60%% of "
+                             "the container memory limit, at most 384)")
+    parser.add_argument("--max-concurrent", type=int,
+                        default=int(os.environ.get("LOCAL_SEARCH_MAX_CONCURRENT", 4)),
+                        help="Maximum concurrent requests (env: LOCAL_SEARCH_MAX_CONCURRENT)")
+    parser.add_argument("--watch-root", action="store_true",
+                        default=os.environ.get("LOCAL_SEARCH_WATCH_ROOT", "") not in ("", "0", "false"),
+                        help="Watch the search root for changes to re-warm the cache "
+                             "(env: LOCAL_SEARCH_WATCH_ROOT)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
     
     args = parser.parse_args()
@@ -795,7 +3143,8 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
     
     # Create and run the server
-    server = LocalSearchMCP(args.search_root)
+    server = LocalSearchMCP(args.search_root, args.memory_budget_mb, args.max_concurrent,
+                            args.watch_root)
     
     try:
         asyncio.run(server.run())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the pure helpers behind query planning and file selection.
+Run with: python -m unittest test_local_search_mcp
+"""
+
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from local_search_mcp import FileIndexer, IgnoreFilter, QueryPlanner
+
+
+class ExtractLiteralTest(unittest.TestCase):
+    """QueryPlanner.extract_literal finds a literal every match must contain."""
+
+    def check(self, pattern: str, literal: str):
+        self.assertEqual(QueryPlanner.extract_literal(pattern, is_regex=True), literal, pattern)
+
+    def test_plain_text_is_its_own_literal(self):
+        self.assertEqual(QueryPlanner.extract_literal('a.b*c'), 'a.b*c')
+
+    def test_longest_run_between_metacharacters(self):
+        self.check(r'def \w+\(', 'def ')
+        self.check('foo.barbaz', 'barbaz')
+        self.check(r'a\.b\.cd', 'a.b.cd')
+
+    def test_quantifiers(self):
+        self.check('abc?d', 'ab')
+        self.check('hel+o', 'hel')
+        self.check('x{2,3}yy', 'yy')
+
+    def test_alternation(self):
+        self.check('foo|bar', '')
+        self.check('(foo|bar)bazz', 'bazz')
+
+    def test_character_classes(self):
+        self.check('[(]hello', 'hello')
+        self.check('foo[abc]barbaz', 'barbaz')
+        self.check('[]x]hello', 'hello')
+        self.check('[^]x]hello', 'hello')
+        self.check(r'[\]]hello', 'hello')
+        self.check('[[:alpha:]]+world', 'world')
+        self.check('(ab[)]c)zz', 'zz')
+        self.check('[unclosed', '')
+
+
+class CostModelTest(unittest.TestCase):
+    """QueryPlanner's selectivity bounds, cost estimates and backend choice."""
+
+    def setUp(self):
+        self.planner = QueryPlanner()
+
+    def plan(self, backends, tree_size, query='needle', limit=50):
+        directory = Path('/nonexistent')
+        self.planner.tree_sizes[str(directory)] = (tree_size, time.time())
+        return self.planner.plan('content_search', directory, query, backends, limit)
+
+    def test_selectivity_bounds(self):
+        self.assertEqual(QueryPlanner.estimate_selectivity(''), 1.0)
+        self.assertEqual(QueryPlanner.estimate_selectivity('a'), QueryPlanner.MAX_SELECTIVITY)
+        self.assertEqual(QueryPlanner.estimate_selectivity('a' * 40), QueryPlanner.MIN_SELECTIVITY)
+
+    def test_early_exit_caps_files_scanned(self):
+        full = self.planner.estimate_cost('content_search', 'ripgrep', 10 ** 6, 1.0, 10 ** 7)
+        early = self.planner.estimate_cost('content_search', 'ripgrep', 10 ** 6, 1.0, 10)
+        self.assertLess(early, full)
+
+    def test_small_tree_prefers_python(self):
+        self.assertEqual(self.plan(['ripgrep', 'python'], 10).backend, 'python')
+
+    def test_large_tree_never_uses_python(self):
+        plan = self.plan(['ripgrep', 'python'], QueryPlanner.PYTHON_MAX_TREE_SIZE + 1)
+        self.assertEqual(plan.backend, 'ripgrep')
+        self.assertNotIn('python', plan.estimates)
+
+    def test_python_only_when_nothing_else(self):
+        self.assertEqual(self.plan(['python'], 10 ** 6).backend, 'python')
+
+    def test_record_adjusts_estimate(self):
+        plan = self.plan(['ripgrep'], 10 ** 5)
+        self.planner.record(plan, plan.estimates['ripgrep'] * 10)
+        self.assertGreater(self.planner.corrections[('content_search', 'ripgrep')], 1.0)
+
+
+class GlobTest(unittest.TestCase):
+    """IgnoreFilter.compile_glob matches paths like ripgrep's globs."""
+
+    def matches(self, pattern: str, path: str) -> bool:
+        return IgnoreFilter.compile_glob(pattern).match(path) is not None
+
+    def test_translate_glob(self):
+        self.assertEqual(IgnoreFilter.translate_glob('*.py'), r'[^/]*\.py')
+        self.assertEqual(IgnoreFilter.translate_glob('**/a'), '(?:.*/)?a')
+        self.assertEqual(IgnoreFilter.translate_glob('[!ab]'), '[^ab]')
+        self.assertEqual(IgnoreFilter.translate_glob(r'\*'), r'\*')
+
+    def test_name_globs_match_at_any_depth(self):
+        self.assertTrue(self.matches('*.py', 'a.py'))
+        self.assertTrue(self.matches('*.py', 'src/pkg/a.py'))
+        self.assertFalse(self.matches('*.py', 'a.pyc'))
+
+    def test_globs_with_a_slash_are_anchored(self):
+        self.assertTrue(self.matches('src/*.py', 'src/a.py'))
+        self.assertFalse(self.matches('src/*.py', 'lib/src/a.py'))
+        self.assertFalse(self.matches('src/*.py', 'src/pkg/a.py'))
+        self.assertTrue(self.matches('/build', 'build'))
+
+    def test_double_star(self):
+        self.assertTrue(self.matches('**/*.js', 'a/b/c.js'))
+        self.assertTrue(self.matches('**/*.js', 'c.js'))
+        self.assertTrue(self.matches('docs/**', 'docs/a/b.md'))
+
+    def test_character_classes(self):
+        self.assertTrue(self.matches('file[0-9].txt', 'file7.txt'))
+        self.assertFalse(self.matches('file[!0-9].txt', 'file7.txt'))
+        self.assertTrue(self.matches('[ab', '[ab'))
+
+    def test_last_matching_rule_wins(self):
+        base = Path('/repo')
+        rules = [
+            (base, IgnoreFilter.compile_glob('*.log'), False, False),
+            (base, IgnoreFilter.compile_glob('keep.log'), True, False),
+            (base, IgnoreFilter.compile_glob('out'), False, True),
+        ]
+        self.assertTrue(IgnoreFilter.ignored(base / 'a.log', False, rules))
+        self.assertFalse(IgnoreFilter.ignored(base / 'keep.log', False, rules))
+        self.assertTrue(IgnoreFilter.ignored(base / 'out', True, rules))
+        self.assertFalse(IgnoreFilter.ignored(base / 'out', False, rules))
+
+
+class FileInfoSpillTest(unittest.TestCase):
+    """FileIndexer keeps the spilled file-info table bounded."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.indexer = FileIndexer(str(Path(directory.name) / 'cache.db'))
+
+    def spill(self, inodes, max_age=3600.0, max_rows=100):
+        entries = [((1, inode, 10, 0), ('text/plain', ['line'])) for inode in inodes]
+        self.indexer.spill_file_info(entries, max_age, max_rows)
+
+    def age(self, inode, seconds):
+        conn = sqlite3.connect(self.indexer.db_path)
+        conn.execute('UPDATE file_info_cache SET spilled_at = spilled_at - ? WHERE inode = ?',
+                     (seconds, inode))
+        conn.commit()
+        conn.close()
+
+    def test_old_rows_expire(self):
+        self.spill([1, 2])
+        self.age(1, 7200)
+        self.spill([3])
+        self.assertIsNone(self.indexer.load_file_info((1, 1, 10, 0)))
+        self.assertEqual(self.indexer.load_file_info((1, 2, 10, 0)), ('text/plain', ['line']))
+
+    def test_oldest_rows_go_beyond_max_rows(self):
+        self.spill([1, 2, 3])
+        self.age(1, 20)
+        self.age(2, 10)
+        self.spill([4], max_rows=2)
+        self.assertIsNone(self.indexer.load_file_info((1, 1, 10, 0)))
+        self.assertIsNone(self.indexer.load_file_info((1, 2, 10, 0)))
+        self.assertIsNotNone(self.indexer.load_file_info((1, 3, 10, 0)))
+        self.assertIsNotNone(self.indexer.load_file_info((1, 4, 10, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()